@@ -16,6 +16,9 @@ setup(
         'numpy==1.26.3',
         'PyYAML==6.0.1'
     ],
+    extras_require = {
+        'jit': ['numba']
+    },
     entry_points = {
         'console_scripts': [
             "csim = src:main"
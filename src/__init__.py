@@ -1 +1 @@
-from .csimulation import main
+from .cli import main
@@ -0,0 +1,120 @@
+"""Online statistics over replicates of a simulation"""
+
+import numpy as np
+
+
+class P2Quantile:
+    """
+    Streaming estimate of a quantile of array-valued samples with P²
+    algorithm (Jain & Chlamtac), element-wise. Keeps five markers per
+    element instead of the samples themselves
+    """
+
+    def __init__(self, quantile: float, shape: tuple) -> None:
+        """Initialize estimator of the quantile from [0, 1]"""
+        self.quantile = quantile
+        self.count = 0
+        self.initial = []
+
+        self.heights = np.zeros((5, *shape))
+        self.positions = np.zeros((5, *shape))
+        self.desired = np.array([0, 2 * quantile, 4 * quantile, 2 + 2 * quantile, 4])
+        self.increments = np.array([0, quantile / 2, quantile, (1 + quantile) / 2, 1])
+
+    def add(self, sample: np.ndarray) -> None:
+        """Add sample to the estimate"""
+        self.count += 1
+
+        if self.count <= 5:
+            self.initial.append(np.asarray(sample, dtype=float))
+            if self.count == 5:
+                self.heights = np.sort(np.stack(self.initial), axis=0)
+                self.positions = np.broadcast_to(
+                    np.arange(5.0).reshape(5, *[1] * (self.heights.ndim - 1)),
+                    self.heights.shape,
+                ).copy()
+                self.initial = []
+            return
+
+        heights, positions = self.heights, self.positions
+        sample = np.asarray(sample, dtype=float)
+
+        np.minimum(heights[0], sample, out=heights[0])
+        np.maximum(heights[4], sample, out=heights[4])
+        # Markers above the sample are shifted by one
+        positions[1:] += sample < heights[1:]
+        positions[4] += sample >= heights[4]
+        self.desired += self.increments
+
+        for i in range(1, 4):
+            delta = self.desired[i] - positions[i]
+            move_up = (delta >= 1) & (positions[i + 1] - positions[i] > 1)
+            move_down = (delta <= -1) & (positions[i - 1] - positions[i] < -1)
+            step = np.where(move_up, 1.0, np.where(move_down, -1.0, 0.0))
+            if not step.any():
+                continue
+
+            with np.errstate(divide="ignore", invalid="ignore"):
+                parabolic = heights[i] + step / (positions[i + 1] - positions[i - 1]) * (
+                    (positions[i] - positions[i - 1] + step)
+                    * (heights[i + 1] - heights[i]) / (positions[i + 1] - positions[i])
+                    + (positions[i + 1] - positions[i] - step)
+                    * (heights[i] - heights[i - 1]) / (positions[i] - positions[i - 1])
+                )
+                neighbor = np.where(step > 0, i + 1, i - 1)
+                neighbor_heights = np.take_along_axis(heights, neighbor[None], axis=0)[0]
+                neighbor_positions = np.take_along_axis(positions, neighbor[None], axis=0)[0]
+                linear = heights[i] + step * (neighbor_heights - heights[i]) / (
+                    neighbor_positions - positions[i]
+                )
+
+            use_parabolic = (heights[i - 1] < parabolic) & (parabolic < heights[i + 1])
+            moved = step != 0
+            heights[i] = np.where(moved, np.where(use_parabolic, parabolic, linear), heights[i])
+            positions[i] += step
+
+    @property
+    def value(self) -> np.ndarray:
+        """Return current estimate of the quantile"""
+        if self.count == 0:
+            return np.full(self.heights.shape[1:], np.nan)
+        if self.count < 5:
+            return np.quantile(np.stack(self.initial), self.quantile, axis=0)
+        return self.heights[2].copy()
+
+
+class OnlineStatistics:
+    """
+    Mean and variance (Welford) and quantiles (P²) of array-valued
+    samples, updated one sample at a time
+    """
+
+    def __init__(self, shape: tuple, quantiles=(0.05, 0.5, 0.95)) -> None:
+        """Initialize statistics of samples with given shape"""
+        self.count = 0
+        self.mean = np.zeros(shape)
+        self.squared_deviations = np.zeros(shape)
+        self.quantiles = {quantile: P2Quantile(quantile, shape) for quantile in quantiles}
+
+    def add(self, sample: np.ndarray) -> None:
+        """Add sample to the statistics"""
+        sample = np.asarray(sample, dtype=float)
+        self.count += 1
+
+        delta = sample - self.mean
+        self.mean += delta / self.count
+        self.squared_deviations += delta * (sample - self.mean)
+
+        for estimator in self.quantiles.values():
+            estimator.add(sample)
+
+    @property
+    def variance(self) -> np.ndarray:
+        """Return sample variance"""
+        if self.count < 2:
+            return np.zeros_like(self.mean)
+        return self.squared_deviations / (self.count - 1)
+
+    def quantile(self, quantile: float) -> np.ndarray:
+        """Return estimate of one of the tracked quantiles"""
+        return self.quantiles[quantile].value
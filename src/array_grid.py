@@ -0,0 +1,154 @@
+"""Array-backed grid"""
+
+from time import perf_counter
+import numpy as np
+from .entity import (
+    Entity,
+    state_of,
+    EMPTY,
+    CANCER,
+    STEM,
+    QUIESCENT,
+    NECROTIC,
+    IMMUNE,
+    QUIESCENT_STEM,
+)
+from .lattice import Geometry
+from .palette import (
+    EMPTY_CODE,
+    STEM_CODE,
+    NECROTIC_CODE,
+    IMMUNE_CODE,
+    CANCER_CODE,
+    MAX_POTENTIAL_CODE,
+)
+
+
+# Palette code of each state code, cancer cells get code by potential
+STATE_CODES = np.zeros(QUIESCENT_STEM + 1, dtype=np.uint8)
+STATE_CODES[[EMPTY, STEM, QUIESCENT_STEM, NECROTIC, IMMUNE]] = (
+    EMPTY_CODE, STEM_CODE, STEM_CODE, NECROTIC_CODE, IMMUNE_CODE
+)
+
+
+class ArrayGrid:
+    """
+    Grid that stores the lattice as flat NumPy arrays instead of
+    Cell and Entity objects. Site (x, y) has index y * width + x
+    """
+
+    def __init__(self, width=1000, height=1000, geometry: Geometry = None) -> None:
+        """Initialize the grid"""
+        started = perf_counter()
+
+        self.width = width
+        self.height = height
+
+        if geometry is None:
+            geometry = Geometry.compute(width, height)
+        geometry.check_size(width, height)
+        self.geometry = geometry
+        self.distance = geometry.distance
+        self.phi = geometry.phi
+        self.neighbor_table = geometry.neighbors
+
+        size = width * height
+        self.state = np.zeros(size, dtype=np.uint8)
+        self.potential = np.zeros(size, dtype=np.int32)
+        self.energy = np.zeros(size, dtype=np.int32)
+        # Number of sites with each state code
+        self.counts = np.zeros(QUIESCENT_STEM + 1, dtype=np.int64)
+        self.counts[EMPTY] = size
+
+        # State codes and potentials of the last frame, see track_dirty_sites
+        self.shown_state = None
+        self.shown_potential = None
+
+        self.build_time = perf_counter() - started
+
+    @property
+    def center(self) -> tuple[int, int]:
+        """Return coordinate of center"""
+        return (self.width // 2, self.height // 2)
+
+    @property
+    def cells(self) -> np.ndarray:
+        """Return indices of occupied sites"""
+        return np.flatnonzero(self.state)
+
+    def render(self, frame: np.ndarray) -> None:
+        """Write palette code of each site into (height, width) frame"""
+        frame.reshape(-1)[:] = self.codes_of(np.arange(self.state.size))
+
+    @property
+    def occupied_indices(self) -> np.ndarray:
+        """Return indices of occupied sites"""
+        return self.cells
+
+    def codes_of(self, sites: np.ndarray) -> np.ndarray:
+        """Return palette codes of the sites"""
+        states = self.state[sites]
+        codes = STATE_CODES[states]
+        cancer = (states == CANCER) | (states == QUIESCENT)
+        codes[cancer] = CANCER_CODE + np.clip(self.potential[sites[cancer]], 0, MAX_POTENTIAL_CODE)
+        return codes
+
+    def track_dirty_sites(self) -> None:
+        """Start keeping state of the last frame, see pop_dirty_sites"""
+        if self.shown_state is None:
+            self.shown_state = np.zeros_like(self.state)
+            self.shown_potential = np.zeros_like(self.potential)
+
+    def pop_dirty_sites(self) -> np.ndarray:
+        """
+        Return indices of sites changed since last call. Kernel does not
+        track changes, so state is compared with the last frame
+        """
+        sites = np.flatnonzero((self.state != self.shown_state)
+                               | (self.potential != self.shown_potential))
+        self.shown_state[sites] = self.state[sites]
+        self.shown_potential[sites] = self.potential[sites]
+        return sites
+
+    def index_of(self, x: int, y: int) -> int:
+        """Return index of the site by coordinates"""
+        return (y % self.height) * self.width + x % self.width
+
+    def place(self, state: int, x: int, y: int, proliferation_potential=0) -> None:
+        """Place state code on grid by coordinates"""
+        if not -self.width < x < self.width or not -self.height < y < self.height:
+            raise ValueError("You cannot put an entity outside the boundaries")
+
+        self.place_sites(np.array([self.index_of(x, y)]), state, proliferation_potential)
+
+    def place_sites(self, sites: np.ndarray, state: int, proliferation_potential=0) -> None:
+        """Place state code on distinct sites by indices"""
+        np.subtract.at(self.counts, self.state[sites], 1)
+        self.counts[state] += len(sites)
+
+        self.state[sites] = state
+        self.potential[sites] = proliferation_potential
+        self.energy[sites] = 0
+
+    def place_entity(self, entity: Entity, x: int, y: int) -> None:
+        """Place entity on grid by coordinates, converting it to state code"""
+        state, potential = state_of(entity)
+        self.place(state, x, y, potential)
+
+    def clear(self) -> None:
+        """Make all sites empty"""
+        self.place_sites(self.cells, EMPTY)
+
+    def remove(self, site: int) -> None:
+        """Make site empty"""
+        self.place_sites(np.array([site]), EMPTY)
+
+    def to_array(self) -> list[list[int]]:
+        """Return state codes as 2d list"""
+        return self.state.reshape(self.height, self.width).tolist()
+
+    def random_free_sites(self, count: int, rng: np.random.Generator) -> np.ndarray:
+        """Return up to count distinct random empty sites"""
+        free = np.flatnonzero(self.state == EMPTY)
+        count = min(count, len(free))
+        return rng.choice(free, count, replace=False)
@@ -1,20 +1,22 @@
 """Finite automaton"""
 
+import json
+import math
+import os
+import tempfile
 import numpy as np
-from random import randint
-from math import sqrt
 from .grid import Grid
+from .counter import CellCounter
+from .array_grid import ArrayGrid
+from .lattice import Geometry, distance_to_edge
 from .variables import Variables
 from .entity import *
+from .kernel import step_kernel
 
 
-class CellCounter:
-
-    def __init__(self):
-        self.immune_cell = 0
-        self.tumor_cell = 0
-        self.proliferating_cell = 0
-        self.stem_cell = 0
+def checkpoint_path(path: str) -> str:
+    """Return path of checkpoint file, adding .npz extension as NumPy does"""
+    return path if path.endswith(".npz") else path + ".npz"
 
 
 class FiniteAutomaton:
@@ -24,25 +26,28 @@ class FiniteAutomaton:
         """Initialize FiniteAutomaton"""
         self.grid = grid
         self.variables = variables
-        self.edge_cells = []
-        self.counter = None
+
+    @property
+    def counter(self) -> CellCounter:
+        """Return number of cells of each kind on the grid"""
+        return self.grid.counter
+
+    def check_counter(self) -> None:
+        """Raise RuntimeError if counter does not match the grid"""
+        actual = CellCounter.from_entities(cell.entity for cell in self.grid.cells)
+        if actual != self.counter:
+            raise RuntimeError(f"Counter {self.counter} does not match the grid {actual}")
 
     def next(self) -> None:
         """Make step in automaton"""
 
         cells = self.grid.cells.copy()
-        random_variables = np.random.rand(len(cells), 5)
-        self.counter = CellCounter()
-
-        if self.edge_cells:
-            self.variables.Rt = sum(cell.distance for cell in self.edge_cells) // len(
-                self.edge_cells
-            )
+        random_variables = self.variables.rng.random((len(cells), 5))
 
-        edge_cells = []
+        if self.grid.frontier:
+            self.variables.Rt = self.grid.tumor_radius
 
-        for cell in edge_cells:
-            cell.entity.energy_level = 0
+        energy = self.energy_field()
 
         for i, cell in enumerate(cells):
             if cell.empty:
@@ -51,40 +56,116 @@ class FiniteAutomaton:
             entity = cell.entity
 
             entity.cell = cell
-            entity.neighbors = cell.neighbors
-            entity.free_neighbors = cell.get_free_neighbor()
             entity.variables = self.variables
-
-            min_energy_neighbor = min(
-                entity.neighbors,
-                key=lambda c: c.entity.energy_level if c.entity else 0,
-            )
-
-            if min_energy_neighbor.entity:
-                entity.energy_level = min_energy_neighbor.entity.energy_level + 1
-            else:
-                entity.energy_level = 0
-
-            if entity.free_neighbors:
-                edge_cells.append(cell)
-
-            self.counter.immune_cell += 1 if isinstance(entity, ImmuneCell) else 0
-            self.counter.proliferating_cell += 1 if isinstance(entity, (TrueStemCell, CancerCell)) else 0
-            self.counter.tumor_cell += 1 if isinstance(entity, (CancerCell, QuiescentCell, NecroticCell)) else 0
-            self.counter.stem_cell += 1 if isinstance(entity, TrueStemCell) else 0
+            entity.energy_level = int(energy[cell.y, cell.x])
 
             entity.next_state(*random_variables[i])
 
             entity.cell = None
-            entity.neighbors = None
-            entity.free_neighbors = None
-
-        self.edge_cells = edge_cells
 
         self.process_chemotherapy()
         self.spawn_immune_cells()
         self.variables.time_step()
 
+        if self.variables.debug:
+            self.check_counter()
+
+    def save(self, path: str) -> None:
+        """
+        Write checkpoint of the automaton to compressed .npz file: state
+        code, proliferation potential and energy of each occupied site,
+        dynamic variables and state of the random stream. Checkpoint is
+        written to a temporary file which then replaces the previous one,
+        so the file always holds a complete checkpoint
+        """
+        path = checkpoint_path(path)
+        sites, state, potential, energy = self.occupied_sites()
+        variables = self.variables
+
+        file = tempfile.NamedTemporaryFile(dir=os.path.dirname(path) or ".",
+                                           suffix=".tmp", delete=False)
+        try:
+            with file:
+                np.savez_compressed(
+                    file,
+                    width=self.grid.width,
+                    height=self.grid.height,
+                    sites=sites.astype(np.int32),
+                    state=state.astype(np.uint8),
+                    potential=potential.astype(np.int32),
+                    energy=energy.astype(np.int32),
+                    time=variables.time,
+                    injection_number=variables.injection_number,
+                    Rt=variables.Rt,
+                    tumor_center=np.array(variables.tumor_center),
+                    rng=json.dumps(variables.rng.bit_generator.state),
+                )
+            os.replace(file.name, path)
+        except BaseException:
+            os.unlink(file.name)
+            raise
+
+    def load(self, path: str) -> None:
+        """
+        Restore automaton from checkpoint written by save. Static variables
+        are not stored, they are taken from the variables of the automaton
+        """
+        with np.load(checkpoint_path(path)) as checkpoint:
+            size = int(checkpoint["width"]), int(checkpoint["height"])
+            if size != (self.grid.width, self.grid.height):
+                raise ValueError(f"Checkpoint of {size[0]}x{size[1]} grid cannot be loaded "
+                                 f"into {self.grid.width}x{self.grid.height} grid")
+
+            self.grid.clear()
+            self.place_sites(checkpoint["sites"], checkpoint["state"],
+                             checkpoint["potential"], checkpoint["energy"])
+
+            variables = self.variables
+            variables.time = int(checkpoint["time"])
+            variables.injection_number = int(checkpoint["injection_number"])
+            variables.Rt = checkpoint["Rt"].item()
+            variables.tumor_center = tuple(checkpoint["tumor_center"].tolist())
+            variables.rng.bit_generator.state = json.loads(str(checkpoint["rng"]))
+
+    def occupied_sites(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Return indices, state codes, potentials and energies of occupied sites"""
+        sites = self.grid.occupied_indices
+        entities = [self.grid.sites[site].entity for site in sites.tolist()]
+        states = np.array([state_of(entity) for entity in entities], dtype=np.int32).reshape(-1, 2)
+        energy = np.array([getattr(entity, "energy_level", 0) for entity in entities])
+        return sites, states[:, 0], states[:, 1], energy
+
+    def place_sites(self, sites: np.ndarray, state: np.ndarray, potential: np.ndarray,
+                    energy: np.ndarray) -> None:
+        """Place entities with given state codes, potentials and energies on the sites"""
+        for site, code, proliferation_potential, energy_level in zip(
+            sites.tolist(), state.tolist(), potential.tolist(), energy.tolist()
+        ):
+            entity = entity_of(code, proliferation_potential)
+            entity.variables = self.variables
+            entity.energy_level = energy_level
+            self.grid.cell(site).entity = entity
+
+    def place_initial_cells(self, x: int, y: int) -> None:
+        """
+        Place true stem cell with maximal proliferation potential at given
+        coordinates and immune cell in the corner if immune response is on
+        """
+        self.grid.place_entity(
+            TrueStemCell(proliferation_potential=self.variables.max_proliferation_potential), x, y
+        )
+        if self.variables.immune_response:
+            self.grid.place_entity(ImmuneCell(), 1, 1)
+
+    @property
+    def energy_limit(self) -> int:
+        """Return energy level above which cells behave the same way"""
+        return max(self.variables.quiescent_distance, self.variables.necrotic_distance + 1)
+
+    def energy_field(self) -> np.ndarray:
+        """Return energy level of each site of the grid, indexed by y and x"""
+        return distance_to_edge(self.grid.occupied, self.energy_limit)
+
     def process_chemotherapy(self):
         """Process effect of chemotherapy on cell"""
         if self.variables.is_injection_start:
@@ -102,6 +183,126 @@ class FiniteAutomaton:
         if recrutient < 0:
             return
 
-        for _ in range(int(recrutient)):
-            free_cell = self.grid.get_random_free_cell()
+        for free_cell in self.grid.get_random_free_cells(int(recrutient), self.variables.rng):
             free_cell.entity = ImmuneCell()
+
+
+class ArrayAutomaton(FiniteAutomaton):
+    """
+    Finite automaton over ArrayGrid. Applies the rules of the
+    entities from entity.py to state codes instead of Entity objects
+    """
+
+    def next(self) -> None:
+        """Make step in automaton"""
+        grid = self.grid
+        state = grid.state
+
+        self.update_energy()
+        occupied = state != EMPTY
+
+        edge = occupied & (grid.energy == 0)
+        if edge.any():
+            self.variables.Rt = grid.distance[edge].sum() // np.count_nonzero(edge)
+
+        sites = np.flatnonzero(occupied)
+        rng = self.variables.rng
+        rng.shuffle(sites)
+        self.apply_rules(sites, rng.random((len(sites), 8)))
+
+        self.process_chemotherapy()
+        self.spawn_immune_cells()
+        self.variables.time_step()
+
+        if self.variables.debug:
+            self.check_counter()
+
+    @property
+    def counter(self) -> CellCounter:
+        """Return number of cells of each kind on the grid"""
+        return CellCounter.from_state_counts(self.grid.counts)
+
+    def occupied_sites(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Return indices, state codes, potentials and energies of occupied sites"""
+        grid = self.grid
+        sites = grid.cells
+        return sites, grid.state[sites], grid.potential[sites], grid.energy[sites]
+
+    def place_sites(self, sites: np.ndarray, state: np.ndarray, potential: np.ndarray,
+                    energy: np.ndarray) -> None:
+        """Place given state codes, potentials and energies on the sites"""
+        for code in np.unique(state):
+            chosen = state == code
+            self.grid.place_sites(sites[chosen], code, potential[chosen])
+        self.grid.energy[sites] = energy
+
+    def check_counter(self) -> None:
+        """Raise RuntimeError if state counts do not match the grid"""
+        actual = np.bincount(self.grid.state, minlength=len(self.grid.counts))
+        if not np.array_equal(actual, self.grid.counts):
+            raise RuntimeError(f"State counts {self.grid.counts} do not match the grid {actual}")
+
+    def apply_rules(self, sites: np.ndarray, random_variables: np.ndarray) -> None:
+        """
+        Apply transition rules to the sites in given order with
+        step_kernel, compiled with numba if it is available
+        """
+        grid = self.grid
+        variables = self.variables
+
+        chemo_scale = variables.drug_concentration * variables.PK * math.e ** (
+            -variables.ci * variables.days_from_injection
+        )
+
+        step_kernel(
+            grid.state, grid.potential, grid.energy, grid.counts, grid.distance,
+            np.zeros(grid.state.size, dtype=np.bool_),
+            grid.neighbor_table, sites, random_variables,
+            variables.pA, variables.p0, variables.Rmax - variables.Kc,
+            variables.pS, variables.mu, variables.pdT, variables.pdI,
+            variables.quiescent_distance, variables.necrotic_distance,
+            variables.is_treatment, chemo_scale,
+            variables.kPC, variables.yPC * variables.injection_number,
+            variables.kI, variables.yI * variables.injection_number,
+        )
+
+    def update_energy(self) -> None:
+        """Set energy of each site to its distance to the tumor edge"""
+        grid = self.grid
+        occupied = (grid.state != EMPTY).reshape(grid.height, grid.width)
+        grid.energy[:] = distance_to_edge(occupied, self.energy_limit).ravel()
+
+    def spawn_immune_cells(self):
+        """Spawn immune cells on the grid"""
+        if not self.variables.immune_response:
+            return
+
+        needed_immune_cells = self.variables.ics * self.counter.tumor_cell
+
+        recrutient = needed_immune_cells - self.counter.immune_cell
+
+        if recrutient < 0:
+            return
+
+        sites = self.grid.random_free_sites(int(recrutient), self.variables.rng)
+        self.grid.place_sites(sites, IMMUNE)
+
+
+ENGINES = {
+    "object": (Grid, FiniteAutomaton),
+    "array": (ArrayGrid, ArrayAutomaton),
+}
+
+
+def create_automaton(variables: Variables, width: int, height: int,
+                     geometry: Geometry = None) -> FiniteAutomaton:
+    """
+    Return automaton of the engine chosen by variables.engine,
+    geometry of the lattice is computed if not given
+    """
+    if variables.engine not in ENGINES:
+        raise ValueError(f"Unknown engine `{variables.engine}`, "
+                         f"choose one of: {', '.join(ENGINES)}")
+
+    grid_class, automaton_class = ENGINES[variables.engine]
+    return automaton_class(grid_class(width, height, geometry), variables)
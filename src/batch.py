@@ -0,0 +1,261 @@
+"""Batch of replicates of one simulation stepped together"""
+
+import math
+import numpy as np
+from .counter import CellCounter
+from .entity import EMPTY, CANCER, STEM, QUIESCENT, NECROTIC, IMMUNE, QUIESCENT_STEM
+from .lattice import Geometry, distance_to_edge
+from .variables import Variables
+
+
+STATES = QUIESCENT_STEM + 1
+
+
+class BatchAutomaton:
+    """
+    K independent replicates of the same Variables stored as stacked
+    (K, height, width) arrays of state code, proliferation potential and
+    energy. Rules of the array engine are applied to all sites of all
+    replicates at once. Cells act simultaneously in random order of
+    priority: when several of them choose the same empty site, the first
+    one gets it and others choose again among remaining empty neighbors
+    """
+
+    def __init__(self, variables: Variables, replicates: int, width: int, height: int,
+                 geometry: Geometry = None) -> None:
+        """Initialize batch of empty grids"""
+        if geometry is None:
+            geometry = Geometry.compute(width, height)
+        geometry.check_size(width, height)
+
+        self.variables = variables
+        self.replicates = replicates
+        self.width = width
+        self.height = height
+        self.distance = geometry.distance
+        self.neighbor_table = geometry.neighbors
+
+        self.state = np.zeros((replicates, height, width), dtype=np.uint8)
+        self.potential = np.zeros((replicates, height, width), dtype=np.int32)
+        self.energy = np.zeros((replicates, height, width), dtype=np.int32)
+        # Tumor radius of each replicate
+        self.Rt = np.zeros(replicates)
+
+        # Flat views, site (x, y) has index y * width + x
+        size = width * height
+        self._state = self.state.reshape(replicates, size)
+        self._potential = self.potential.reshape(replicates, size)
+        self._energy = self.energy.reshape(replicates, size)
+
+    @property
+    def energy_limit(self) -> int:
+        """Return energy level above which cells behave the same way"""
+        return max(self.variables.quiescent_distance, self.variables.necrotic_distance + 1)
+
+    @property
+    def counts(self) -> np.ndarray:
+        """Return (K, number of states) counts of sites with each state code"""
+        offsets = np.arange(self.replicates)[:, None] * STATES
+        return np.bincount((self._state + offsets).ravel(),
+                           minlength=self.replicates * STATES).reshape(self.replicates, STATES)
+
+    @property
+    def counters(self) -> list[CellCounter]:
+        """Return number of cells of each kind in each replicate"""
+        return [CellCounter.from_state_counts(counts) for counts in self.counts]
+
+    def place_initial_cells(self, x: int, y: int) -> None:
+        """
+        Place true stem cell with maximal proliferation potential at given
+        coordinates and immune cell in the corner of every replicate
+        """
+        self.state[:, y, x] = STEM
+        self.potential[:, y, x] = self.variables.max_proliferation_potential
+        if self.variables.immune_response:
+            self.state[:, 1, 1] = IMMUNE
+
+    def next(self) -> None:
+        """Make step in every replicate"""
+        variables = self.variables
+        rng = variables.rng
+        state, potential, energy = self._state, self._potential, self._energy
+
+        occupied = state != EMPTY
+        energy[...] = distance_to_edge(
+            occupied.reshape(self.state.shape), self.energy_limit
+        ).reshape(state.shape)
+
+        edge = occupied & (energy == 0)
+        edge_count = np.count_nonzero(edge, axis=1)
+        has_edge = edge_count > 0
+        self.Rt[has_edge] = (edge @ self.distance)[has_edge] // edge_count[has_edge]
+
+        replicate, site = np.nonzero(occupied)
+        order = rng.permutation(len(site))
+        replicate, site = replicate[order], site[order]
+        random_values = rng.random((len(site), 8))
+
+        self.apply_rules(replicate, site, random_values)
+
+        if variables.is_injection_start:
+            variables.injection_number += 1
+        self.spawn_immune_cells()
+        variables.time_step()
+
+    def apply_rules(self, replicate: np.ndarray, site: np.ndarray,
+                    random_values: np.ndarray) -> None:
+        """
+        Apply rules of the cells at given sites in given priority order,
+        random values have the same columns as in step_kernel
+        """
+        variables = self.variables
+        state, potential, energy = self._state, self._potential, self._energy
+        cell_state = state[replicate, site]
+        cell_energy = energy[replicate, site]
+
+        chemo_scale = variables.drug_concentration * variables.PK * math.e ** (
+            -variables.ci * variables.days_from_injection
+        )
+
+        stem = cell_state == STEM
+        cancer = stem | (cell_state == CANCER)
+        immune = cell_state == IMMUNE
+        alive = np.ones(len(site), dtype=np.bool_)
+
+        # Apoptosis
+        alive &= ~(cancer & ~stem & (random_values[:, 0] <= variables.pA))
+
+        # Division
+        divides = cancer & alive & (
+            random_values[:, 1]
+            <= variables.p0 * (1 - self.distance[site] / (variables.Rmax - variables.Kc))
+        )
+        target = self.claim_free_neighbors(replicate, site, random_values[:, 5], divides)
+        divides &= target >= 0
+        exhausted = divides & (potential[replicate, site] <= 0)
+        alive &= ~exhausted
+        divides &= ~exhausted
+        self.remove(replicate[~alive], site[~alive])
+
+        mother = replicate[divides], site[divides]
+        potential[mother] -= (~stem[divides]).astype(np.int32)
+        daughter = np.where(stem[divides] & (random_values[divides, 6] <= variables.pS),
+                            STEM, CANCER)
+        state[replicate[divides], target[divides]] = daughter
+        potential[replicate[divides], target[divides]] = potential[mother]
+        energy[replicate[divides], target[divides]] = 0
+
+        # Migration of cancer cells and movement of immune cells
+        moves = alive & (immune | (cancer & (random_values[:, 2] <= variables.mu)))
+        target = self.claim_free_neighbors(replicate, site, random_values[:, 7], moves)
+        moves &= target >= 0
+        source, destination = (replicate[moves], site[moves]), (replicate[moves], target[moves])
+        state[destination] = state[source]
+        potential[destination] = potential[source]
+        energy[destination] = energy[source]
+        self.remove(*source)
+        site = np.where(moves, target, site)
+
+        # Chemotherapy
+        if variables.is_treatment:
+            killed = cancer & ~stem & alive & (
+                random_values[:, 4] <= variables.kPC * chemo_scale
+                / (random_values[:, 3] * variables.yPC * variables.injection_number + 1)
+            )
+            self.remove(replicate[killed], site[killed])
+            alive &= ~killed
+
+        # Quiescence and necrosis
+        quiescent = cell_state == QUIESCENT
+        quiescent_stem = cell_state == QUIESCENT_STEM
+        new_state = cell_state.copy()
+        new_state[stem & (cell_energy >= variables.quiescent_distance)] = QUIESCENT_STEM
+        new_state[cancer & ~stem & (cell_energy >= variables.quiescent_distance)] = QUIESCENT
+        new_state[cancer & (cell_energy >= variables.necrotic_distance)] = NECROTIC
+        new_state[quiescent & (cell_energy < variables.quiescent_distance)] = CANCER
+        new_state[quiescent_stem & (cell_energy < variables.quiescent_distance)] = STEM
+        new_state[(quiescent | quiescent_stem)
+                  & (cell_energy > variables.necrotic_distance)] = NECROTIC
+        changes = alive & (cancer | quiescent | quiescent_stem)
+        state[replicate[changes], site[changes]] = new_state[changes]
+
+        # Immune response to the first tumor cell among the neighbors
+        immune &= alive
+        neighbors = self.neighbor_table[site[immune]]
+        neighbor_state = state[replicate[immune, None], neighbors]
+        tumor = (neighbor_state != EMPTY) & (neighbor_state != IMMUNE)
+        fights = tumor.any(axis=1)
+        first_tumor = neighbors[np.arange(len(neighbors)), tumor.argmax(axis=1)]
+
+        fighters = np.flatnonzero(immune)[fights]
+        kills = random_values[fighters, 3] <= variables.pdT
+        self.remove(replicate[fighters[kills]], first_tumor[fights][kills])
+        alive[fighters[random_values[fighters, 4] <= variables.pdI]] = False
+
+        dies = immune & ~alive
+        if variables.is_treatment:
+            alive &= ~(immune & (
+                random_values[:, 2] <= variables.kI * chemo_scale
+                / (random_values[:, 1] * variables.yI * variables.injection_number + 1)
+            ))
+            dies |= immune & ~alive
+        self.remove(replicate[dies], site[dies])
+
+    def claim_free_neighbors(self, replicate: np.ndarray, site: np.ndarray,
+                             random_values: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        """
+        Return random empty neighbor of each masked site, chosen by the
+        random value from [0, 1), or -1 if there is none or site is not
+        masked. Sites claim neighbors in rounds: the first of the sites
+        that chose the same neighbor gets it, others choose again among
+        neighbors that are still free
+        """
+        target = np.full(len(site), -1, dtype=np.int64)
+        claimed = np.zeros(self._state.shape, dtype=np.bool_)
+        pending = np.flatnonzero(mask)
+
+        while len(pending):
+            neighbors = self.neighbor_table[site[pending]]
+            rows = replicate[pending, None]
+            free = (self._state[rows, neighbors] == EMPTY) & ~claimed[rows, neighbors]
+            count = np.count_nonzero(free, axis=1)
+            pending, neighbors, free = pending[count > 0], neighbors[count > 0], free[count > 0]
+
+            chosen = (random_values[pending] * count[count > 0]).astype(np.int64)
+            pick = free & (np.cumsum(free, axis=1) - 1 == chosen[:, None])
+            choice = neighbors[np.arange(len(pending)), pick.argmax(axis=1)]
+
+            # Pending sites are in priority order, so first claim wins
+            _, first = np.unique(replicate[pending] * self._state.shape[1] + choice,
+                                 return_index=True)
+            target[pending[first]] = choice[first]
+            claimed[replicate[pending[first]], choice[first]] = True
+            pending = np.delete(pending, first)
+
+        return target
+
+    def remove(self, replicate: np.ndarray, site: np.ndarray) -> None:
+        """Make sites empty"""
+        self._state[replicate, site] = EMPTY
+        self._potential[replicate, site] = 0
+        self._energy[replicate, site] = 0
+
+    def spawn_immune_cells(self) -> None:
+        """Spawn immune cells on random empty sites of each replicate"""
+        if not self.variables.immune_response:
+            return
+
+        counts = self.counts
+        tumor = counts[:, [CANCER, STEM, QUIESCENT, QUIESCENT_STEM, NECROTIC]].sum(axis=1)
+        recrutient = self.variables.ics * tumor - counts[:, IMMUNE]
+        needed = np.where(recrutient < 0, 0, recrutient.astype(np.int64))
+        if not needed.any():
+            return
+
+        # Only a few sites are needed, so they are sampled per replicate
+        # instead of shuffling whole lattices
+        rng = self.variables.rng
+        for replicate in np.flatnonzero(needed):
+            free = np.flatnonzero(self._state[replicate] == EMPTY)
+            sites = rng.choice(free, min(needed[replicate], len(free)), replace=False)
+            self._state[replicate, sites] = IMMUNE
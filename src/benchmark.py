@@ -0,0 +1,80 @@
+"""
+Startup benchmark: time to build the grid and to get the first
+frame from a fresh automaton, for each engine
+"""
+import argparse
+from time import perf_counter
+import numpy as np
+from .automaton import ENGINES, create_automaton
+from .batch import BatchAutomaton
+from .entity import TrueStemCell, ImmuneCell
+from .variables import Variables
+
+
+def measure_startup(engine: str, width: int, height: int, steps=10) -> dict:
+    """
+    Return grid construction time, time to first frame and mean
+    step time of the following steps, in seconds
+    """
+    variables = Variables(name=engine, engine=engine)
+
+    started = perf_counter()
+    automaton = create_automaton(variables, width, height)
+    automaton.grid.place_entity(
+        TrueStemCell(proliferation_potential=variables.max_proliferation_potential),
+        width // 2,
+        height // 2,
+    )
+    automaton.grid.place_entity(ImmuneCell(), 1, 1)
+    automaton.next()
+    automaton.grid.render(np.empty((height, width), dtype=np.uint8))
+    first_frame = perf_counter() - started
+
+    started = perf_counter()
+    for _ in range(steps):
+        automaton.next()
+    step = (perf_counter() - started) / steps if steps else 0
+
+    return {
+        "engine": engine,
+        "grid": automaton.grid.build_time,
+        "first_frame": first_frame,
+        "step": step,
+    }
+
+
+def measure_batch_throughput(replicates: int, width: int, height: int, steps=10) -> float:
+    """Return replicate-steps per second of BatchAutomaton with given batch size"""
+    variables = Variables(name="batch")
+    automaton = BatchAutomaton(variables, replicates, width, height)
+    automaton.place_initial_cells(width // 2, height // 2)
+
+    started = perf_counter()
+    for _ in range(steps):
+        automaton.next()
+    return replicates * steps / (perf_counter() - started)
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description="Cancer simulation startup benchmark.")
+    argument_parser.add_argument("--size", type=int, nargs=2, default=(400, 400),
+                                 metavar=("WIDTH", "HEIGHT"))
+    argument_parser.add_argument("--steps", type=int, default=10)
+    argument_parser.add_argument("--engine", choices=list(ENGINES), action="append")
+    argument_parser.add_argument("--batch", type=int,
+                                 help="also measure throughput of batch of replicates")
+    args = argument_parser.parse_args()
+
+    print(f"{'engine':<8} {'grid, ms':>10} {'first frame, ms':>16} {'step, ms':>10}")
+    for engine in args.engine or ENGINES:
+        result = measure_startup(engine, *args.size, steps=args.steps)
+        print(f"{engine:<8} {result['grid'] * 1000:>10.1f} "
+              f"{result['first_frame'] * 1000:>16.1f} {result['step'] * 1000:>10.1f}")
+
+    if args.batch:
+        throughput = measure_batch_throughput(args.batch, *args.size, steps=args.steps)
+        print(f"batch of {args.batch}: {throughput:.1f} replicate-steps per second")
+
+
+if __name__ == "__main__":
+    main()
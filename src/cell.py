@@ -1,5 +1,7 @@
 """Cell"""
 
+from .lattice import FREE_DIRECTIONS
+
 
 class Cell:
     """
@@ -10,23 +12,18 @@ class Cell:
     __dict__ = [
         "x",
         "y",
+        "index",
+        "grid",
         "_entity",
-        "neighbors",
-        "add_entity_callback",
-        "remove_entity_callback",
     ]
 
-    def __init__(self, x: int, y: int, entity=None) -> None:
+    def __init__(self, x: int, y: int, entity=None, index=0, grid=None) -> None:
         """Initialize cell"""
         self.x = x
         self.y = y
+        self.index = index
+        self.grid = grid
         self._entity = entity
-        self.neighbors = []
-        self.distance = 0
-        self.phi = 0
-
-        self.add_entity_callback = None
-        self.remove_entity_callback = None
 
     def __hash__(self):
         return hash((self.x, self.y))
@@ -42,13 +39,28 @@ class Cell:
     @entity.setter
     def entity(self, entity_) -> None:
         if self.empty and entity_ is not None:
-            self.add_entity_callback(self)
+            self.grid.add_active_cell(self)
 
         if entity_ is None and not self.empty:
-            self.remove_entity_callback(self)
+            self.grid.remove_active_cell(self)
+
+        if entity_ is not self._entity:
+            self.grid.counter.replace(self._entity, entity_)
+            if self.grid.dirty_sites is not None:
+                self.grid.dirty_sites.add(self.index)
 
         self._entity = entity_
 
+    @property
+    def distance(self) -> float:
+        """Return distance from the center of the grid"""
+        return self.grid.distance[self.index]
+
+    @property
+    def phi(self) -> float:
+        """Return angle from the center of the grid"""
+        return self.grid.phi[self.index]
+
     @property
     def empty(self) -> bool:
         """Return true if cell is empty"""
@@ -65,6 +77,34 @@ class Cell:
             return self.entity.color
         return 0, 0, 0
 
+    @property
+    def neighbors(self) -> list["Cell"]:
+        """Return all adjacent cells"""
+        return [self.grid.cell(i) for i in self.grid.neighbor_table[self.index]]
+
+    @property
+    def occupied_neighbors(self) -> list["Cell"]:
+        """Return adjacent cells that are not empty"""
+        mask = self.grid.neighbor_masks[self.index]
+        neighbors = self.grid.neighbor_table[self.index]
+        return [self.grid.sites[neighbors[k]] for k in range(8) if mask >> k & 1]
+
     def get_free_neighbor(self):
         """Return empty cell"""
-        return [cell for cell in self.neighbors if cell.empty]
+        neighbors = self.grid.neighbor_table[self.index]
+        return [
+            self.grid.cell(neighbors[k])
+            for k in FREE_DIRECTIONS[self.grid.neighbor_masks[self.index]]
+        ]
+
+    def get_random_free_neighbor(self, random_value: float):
+        """
+        Return empty adjacent cell chosen by random value
+        from [0, 1) or None if there is no such cell
+        """
+        directions = FREE_DIRECTIONS[self.grid.neighbor_masks[self.index]]
+        if not directions:
+            return None
+
+        k = directions[int(random_value * len(directions))]
+        return self.grid.cell(self.grid.neighbor_table[self.index, k])
@@ -0,0 +1,130 @@
+"""Command line interface"""
+
+import argparse
+import os
+import sys
+from .constants import GRID_SIZE, EXPORT_INTERVAL
+from .export import EXPORTERS
+from .variables import read_variables, read_global_variables
+
+
+COMMANDS = ("gui", "run", "replicates", "branch", "replay")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Return parser of command line arguments"""
+    parser = argparse.ArgumentParser(prog="csim", description="Cancer simulation.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    gui = subparsers.add_parser("gui", help="show simulations in pygame window")
+    gui.add_argument("config_file", type=str)
+
+    run = subparsers.add_parser("run", help="run simulations")
+    run.add_argument("config_file", type=str)
+    run.add_argument("--headless", action="store_true",
+                     help="run without pygame and write results to the output directory")
+    run.add_argument("--steps", type=int, help="number of steps in headless mode")
+    run.add_argument("--output", type=str, default="results",
+                     help="output directory in headless mode")
+    run.add_argument("--size", type=int, nargs=2, default=GRID_SIZE,
+                     metavar=("WIDTH", "HEIGHT"), help="grid size in headless mode")
+    run.add_argument("--workers", type=int, default=os.cpu_count(),
+                     help="number of worker processes in headless mode")
+    run.add_argument("--checkpoint-every", type=int, metavar="STEPS",
+                     help="save automaton to <output>/<name>.npz every STEPS steps "
+                          "in headless mode")
+    run.add_argument("--resume", action="store_true",
+                     help="continue headless runs from their checkpoints")
+    run.add_argument("--export", choices=EXPORTERS,
+                     help="export frames to <output>/<name>_frames in headless mode")
+    run.add_argument("--export-every", type=int, default=EXPORT_INTERVAL, metavar="DAYS",
+                     help="days between exported frames")
+    run.add_argument("--trajectory-every", type=int, metavar="STEPS",
+                     help="append frame to <output>/<name>.traj every STEPS steps "
+                          "in headless mode")
+
+    replicates = subparsers.add_parser(
+        "replicates", help="run independent replicates of simulations without GUI"
+    )
+    replicates.add_argument("config_file", type=str)
+    replicates.add_argument("--replicates", type=int, required=True,
+                            help="number of replicates of each simulation")
+    replicates.add_argument("--steps", type=int, required=True, help="number of steps")
+    replicates.add_argument("--seed", type=int, help="root seed of the random streams")
+    replicates.add_argument("--output", type=str, default="results", help="output directory")
+    replicates.add_argument("--size", type=int, nargs=2, default=GRID_SIZE,
+                            metavar=("WIDTH", "HEIGHT"), help="grid size")
+    replicates.add_argument("--workers", type=int, default=os.cpu_count(),
+                            help="number of worker processes")
+    replicates.add_argument("--batch", type=int, default=1,
+                            help="number of replicates stepped together in one process")
+
+    branch = subparsers.add_parser(
+        "branch", help="grow one tumor and continue it with each simulation without GUI"
+    )
+    branch.add_argument("config_file", type=str)
+    branch.add_argument("--day", type=int,
+                        help="day of branching, treatment_start_time of global section "
+                             "by default")
+    branch.add_argument("--steps", type=int, required=True,
+                        help="number of steps of each branch, including the common ones")
+    branch.add_argument("--output", type=str, default="results", help="output directory")
+    branch.add_argument("--size", type=int, nargs=2, default=GRID_SIZE,
+                        metavar=("WIDTH", "HEIGHT"), help="grid size")
+    branch.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="number of worker processes")
+
+    replay = subparsers.add_parser("replay", help="show frames of trajectory file")
+    replay.add_argument("trajectory_file", type=str)
+    replay.add_argument("--scale", type=int, default=1,
+                        help="each site is shown as SCALE x SCALE pixels")
+
+    return parser
+
+
+def main(argv=None):
+    """
+    Run command line interface. `csim config.yaml` is a shortcut for
+    `csim gui config.yaml`. Pygame is imported only in GUI mode
+    """
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv and argv[0] not in COMMANDS and not argv[0].startswith("-"):
+        argv.insert(0, "gui")
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.command == "run" and args.headless:
+        if args.steps is None:
+            parser.error("--steps is required in headless mode")
+
+        from .runner import run_headless
+        run_headless(read_variables(args.config_file), args.steps, args.output,
+                     *args.size, workers=args.workers,
+                     checkpoint_every=args.checkpoint_every, resume=args.resume,
+                     export=args.export, export_every=args.export_every,
+                     trajectory_every=args.trajectory_every)
+        return
+
+    if args.command == "replicates":
+        from .runner import run_replicates
+        run_replicates(read_variables(args.config_file), args.replicates, args.steps,
+                       args.output, *args.size, seed=args.seed, workers=args.workers,
+                       batch=args.batch)
+        return
+
+    if args.command == "branch":
+        from .runner import run_branches
+        trunk_variables = read_global_variables(args.config_file)
+        day = trunk_variables.treatment_start_time if args.day is None else args.day
+        run_branches(trunk_variables, read_variables(args.config_file), day, args.steps,
+                     args.output, *args.size, workers=args.workers)
+        return
+
+    if args.command == "replay":
+        from .replay import main as replay_main
+        replay_main(args.trajectory_file, args.scale)
+        return
+
+    from .csimulation import main as gui_main
+    gui_main(args.config_file)
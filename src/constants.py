@@ -10,3 +10,44 @@ BUTTON_START = "./assets/icons8-watermelon-100.png"
 BUTTON_STOP = "./assets/icons8-cancel-138.png"
 
 BLOCK_SIZE_DIVISIBLE = 500
+
+# Indentation between simulation panes, x, y
+BETWEEN_IND = SCREEN_WIDTH // 170, SCREEN_HEIGHT // 30
+
+GRID_SIZE = (
+    ((SCREEN_WIDTH // 2) - BETWEEN_IND[0] * 3) // 2,
+    ((SCREEN_HEIGHT - BETWEEN_IND[1] * 3) // 2),
+)  # x,y
+
+GRID_SIZE = min(GRID_SIZE), min(GRID_SIZE)
+
+# Each site of the lattice shown in GUI takes GRID_SCALE x GRID_SCALE pixels
+# of the pane, so the lattice is GRID_SCALE times smaller than the pane
+GRID_SCALE = 1
+LATTICE_SIZE = GRID_SIZE[0] // GRID_SCALE, GRID_SIZE[1] // GRID_SCALE
+
+# How frames of the grid get from step workers to GUI: "delta" sends
+# changed sites through the queue with a keyframe every KEYFRAME_INTERVAL
+# frames, "shared" renders whole frames into shared memory
+FRAME_TRANSPORT = "delta"
+KEYFRAME_INTERVAL = 100
+
+# Frames waiting for GUI in the queue of each simulation. When GUI is slower
+# than the simulation, the oldest frame is dropped
+FRAME_QUEUE_SIZE = 4
+# Upper limit of GUI frame rate
+GUI_FPS = 60
+
+# Frames of the grid saved by step workers every EXPORT_INTERVAL days to
+# capture/<name>/frames: "archive" for compressed .npz archive of palette
+# codes, "video" for .mp4 encoded by ffmpeg, None to save nothing
+EXPORT_FORMAT = "archive"
+EXPORT_INTERVAL = 10
+# Frame rate of exported video
+EXPORT_FPS = 10
+
+# Workers append frame of the grid to capture/<name>/trajectory.traj every
+# TRAJECTORY_INTERVAL steps, None to write no trajectory
+TRAJECTORY_INTERVAL = None
+# Frame rate of playback in replay mode
+REPLAY_FPS = 10
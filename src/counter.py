@@ -0,0 +1,93 @@
+"""Population counters"""
+
+from functools import lru_cache
+from .entity import (
+    CancerCell,
+    QuiescentCell,
+    NecroticCell,
+    TrueStemCell,
+    ImmuneCell,
+    CANCER,
+    STEM,
+    QUIESCENT,
+    NECROTIC,
+    IMMUNE,
+    QUIESCENT_STEM,
+)
+
+
+@lru_cache(maxsize=None)
+def categories_of(entity_class: type) -> tuple[int, int, int, int]:
+    """
+    Return how entity of the class is counted as
+    (immune, tumor, proliferating, stem) cell
+    """
+    return (
+        int(issubclass(entity_class, ImmuneCell)),
+        int(issubclass(entity_class, (CancerCell, QuiescentCell, NecroticCell))),
+        int(issubclass(entity_class, (TrueStemCell, CancerCell))),
+        int(issubclass(entity_class, TrueStemCell)),
+    )
+
+
+class CellCounter:
+    """Number of cells of each kind on the grid"""
+
+    def __init__(self):
+        self.immune_cell = 0
+        self.tumor_cell = 0
+        self.proliferating_cell = 0
+        self.stem_cell = 0
+
+    def add(self, entity, sign=1) -> None:
+        """Count entity placed on the grid"""
+        immune, tumor, proliferating, stem = categories_of(type(entity))
+        self.immune_cell += sign * immune
+        self.tumor_cell += sign * tumor
+        self.proliferating_cell += sign * proliferating
+        self.stem_cell += sign * stem
+
+    def remove(self, entity) -> None:
+        """Uncount entity removed from the grid"""
+        self.add(entity, sign=-1)
+
+    def replace(self, old_entity, new_entity) -> None:
+        """Count replacement of entity in the cell, any of them may be None"""
+        if old_entity is not None:
+            self.remove(old_entity)
+        if new_entity is not None:
+            self.add(new_entity)
+
+    def copy(self) -> "CellCounter":
+        """Return snapshot of the counter"""
+        counter = CellCounter()
+        counter.__dict__.update(self.__dict__)
+        return counter
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, CellCounter) and self.__dict__ == other.__dict__
+
+    def __repr__(self) -> str:
+        return (f"CellCounter(immune_cell={self.immune_cell}, tumor_cell={self.tumor_cell}, "
+                f"proliferating_cell={self.proliferating_cell}, stem_cell={self.stem_cell})")
+
+    @classmethod
+    def from_entities(cls, entities) -> "CellCounter":
+        """Return counter of given entities"""
+        counter = cls()
+        for entity in entities:
+            counter.add(entity)
+        return counter
+
+    @classmethod
+    def from_state_counts(cls, counts) -> "CellCounter":
+        """Return counter from number of sites with each state code"""
+        counter = cls()
+        counter.immune_cell = int(counts[IMMUNE])
+        counter.stem_cell = int(counts[STEM])
+        counter.tumor_cell = int(
+            counts[CANCER] + counts[STEM] + counts[QUIESCENT]
+            + counts[QUIESCENT_STEM] + counts[NECROTIC]
+        )
+        counter.proliferating_cell = counter.tumor_cell
+        return counter
@@ -2,34 +2,39 @@
 Super pygame visualisation with multiprocessing backed up with rust, C and C++ at the same time.
 """
 import os
-from multiprocessing import Process, Queue, Value, Event
+from itertools import count
+from multiprocessing import Process, Queue, Event
+from queue import Empty, Full
+import numpy as np
 import pygame
 import pygame_chart as pyc
 
-from pathlib import Path
 import pygame
-import argparse
-from .automaton import FiniteAutomaton
-from .grid import Grid
-from .entity import TrueStemCell, ImmuneCell
+from .automaton import create_automaton
+from .framebuffer import FrameBuffer
+from .palette import build_palette
+from .recorder import Recorder, metrics_of
+from .export import create_exporter
+from .trajectory import TrajectoryWriter
+from .rendering import TextRenderer, DirtyRects, Label
+from .frames import FrameEncoder, FrameDecoder
+from .lattice import Geometry, SharedGeometry
 from .variables import Variables, read_variables
 
 from .constants import (
     SCREEN_HEIGHT,
     SCREEN_WIDTH,
+    BETWEEN_IND,
+    GRID_SIZE,
+    GRID_SCALE,
+    LATTICE_SIZE,
+    FRAME_TRANSPORT,
+    FRAME_QUEUE_SIZE,
+    GUI_FPS,
+    EXPORT_FORMAT,
+    TRAJECTORY_INTERVAL,
 )
 
-# IN GAME constants
-BETWEEN_IND = SCREEN_WIDTH // 170, SCREEN_HEIGHT // 30  # x, y
-
-
-GRID_SIZE = (
-    ((SCREEN_WIDTH // 2) - BETWEEN_IND[0] * 3) // 2,
-    ((SCREEN_HEIGHT - BETWEEN_IND[1] * 3) // 2),
-)  # x,y
-
-GRID_SIZE = min(GRID_SIZE), min(GRID_SIZE)
-
 
 DASHBOARD_X_Y = 0, BETWEEN_IND[1] * 3 + GRID_SIZE[1] * 2 + 4
 DASHBOARD_SIZE = SCREEN_WIDTH, SCREEN_HEIGHT - GRID_SIZE[1] * 2 - BETWEEN_IND[1] - 4
@@ -40,9 +45,26 @@ screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
 clock = pygame.time.Clock()
 
 pygame.font.init()
-text_font = pygame.font.SysFont("monospace", 30, bold=True)
 
-running_sim = Value("i", 0)
+# Set while simulations are running, step workers wait for it
+running_sim = Event()
+# Set when GUI is closed, step workers stop after it
+stopping = Event()
+# Seconds given to step workers to stop before they are killed
+STOP_TIMEOUT = 5
+
+# Fonts and rendered text are cached, and only changed regions of the
+# screen are passed to display update
+text_renderer = TextRenderer()
+dirty_rects = DirtyRects()
+
+DASHBOARD_COLOR = (174, 198, 207)
+dashboard_labels = {
+    "fps": Label(DASHBOARD_X_Y[0] + 10, DASHBOARD_X_Y[1] + 5, 20, DASHBOARD_COLOR),
+    "status": Label(DASHBOARD_X_Y[0] + 120, DASHBOARD_X_Y[1] + 5, 20, DASHBOARD_COLOR),
+    "days": Label(DASHBOARD_X_Y[0] + 320, DASHBOARD_X_Y[1] + 5, 20, DASHBOARD_COLOR),
+    "config": Label(DASHBOARD_X_Y[0] + 540, DASHBOARD_X_Y[1] + 5, 20, DASHBOARD_COLOR),
+}
 
 
 class Simulation:
@@ -50,7 +72,7 @@ class Simulation:
     Class
     """
 
-    def __init__(self, x: int, y: int, name="Unnamed"):
+    def __init__(self, x: int, y: int, name="Unnamed", variables=None):
         """
         init func
         """
@@ -60,74 +82,82 @@ class Simulation:
         self.y = y
         self.name = name
 
-        self.queue = Queue()
-        self.variables = None
+        self.queue = Queue(maxsize=FRAME_QUEUE_SIZE)
+        self.variables = variables
+
+        # Frames are palette codes of the sites, colored with the palette.
+        # With "delta" transport queue carries changed sites that are applied
+        # by decoder. With "shared" frames are rendered by the step worker
+        # into frame buffer and queue carries only their sequence numbers
+        self.palette = build_palette(variables.color_delta if variables else None)
+        self.frame_buffer = None
+        self.decoder = None
+        if FRAME_TRANSPORT == "delta":
+            self.decoder = FrameDecoder(*LATTICE_SIZE, self.palette)
+            self.picture = self.decoder.picture
+        else:
+            self.frame_buffer = FrameBuffer(*LATTICE_SIZE)
+            self.picture = np.empty((LATTICE_SIZE[1], LATTICE_SIZE[0], 3), dtype=np.uint8)
+        # View of the picture
+        self.surface = pygame.image.frombuffer(self.picture, LATTICE_SIZE, "RGB")
+        # Lattice scaled to the pane if it is smaller
+        self.pane = None
+        if GRID_SCALE > 1:
+            self.pane = pygame.Surface(
+                (LATTICE_SIZE[0] * GRID_SCALE, LATTICE_SIZE[1] * GRID_SCALE), 0, self.surface
+            )
 
         self.x += 1
         self.y += 1
 
         self.days = 0
 
+        self.name_label = Label(self.x, self.y + GRID_SIZE[1] + 2, int(BETWEEN_IND[1] // 1.6))
 
-    def draw(self):
-        """
-        draws sells
-        """
-        if self.queue.empty() or not running_sim.value:
-            return
-
-        pygame.draw.rect(
-            screen,
-            (255, 255, 255),
-            pygame.Rect(self.x, self.y, GRID_SIZE[0], GRID_SIZE[1]),
-        )
-
-        grid, days, self.counter = self.queue.get()
-        self.days = days
-
-        for x, y, color in grid:
-            pygame.draw.rect(
-                screen,
-                color,
-                pygame.Rect(
-                    self.x + x,
-                    self.y + y,
-                    1,
-                    1,
-                ),
-            )
 
-        render_text(
-            self.name, self.x, self.y + GRID_SIZE[1] + 2, font_size=int(BETWEEN_IND[1] // 1.6)
-        )
-
-    # Capture screenshots into given folder
-    def capture_screenshots(self, filepath: str):
-        """
-        Create a video from the screenshots.
-        """
-        Path(filepath).mkdir(parents=True, exist_ok=True)
-        if os.path.exists(filepath) and self.days % 10 == 0:
-            capture_rect = pygame.Rect(self.x, self.y, (GRID_SIZE[0] if not GRID_SIZE[0]%2 else GRID_SIZE[0]+1),
-                                                       (GRID_SIZE[1] if not GRID_SIZE[1]%2 else GRID_SIZE[1]+1))
-            subsurface = screen.subsurface(capture_rect)
-            pygame.image.save(subsurface, f'{filepath}/{self.name}_day_{self.days:05d}.png')
-
-    # Delete all screenshots in the given folder (deletes all .png files!)
-    def delete_screenshots(self, filepath: str):
+    def draw(self) -> bool:
         """
-        Delete all screenshots from past simulations.
+        Take all frames waiting in the queue and draw the latest one.
+        Return True if pane was updated
         """
-        if os.path.exists(filepath):
-            for filename in os.listdir(filepath):
-                file_path = os.path.join(filepath, filename)
-                if (os.path.isfile(file_path) or os.path.islink(file_path)) and filename.endswith('.png'):
-                    os.unlink(file_path)
-
-    @property
-    def has_frames(self) -> bool:
-        """Return True if queue has elements"""
-        return bool(self.queue.qsize())
+        updated = False
+        for _ in range(FRAME_QUEUE_SIZE):
+            try:
+                frame, self.days, self.counter = self.queue.get_nowait()
+            except Empty:
+                break
+
+            if self.decoder is None:
+                updated = True
+            else:
+                updated = self.decoder.apply(frame)
+
+        if not updated:
+            return False
+
+        if self.decoder is None:
+            sequence = self.frame_buffer.latest
+            np.take(self.palette, self.frame_buffer.frame(sequence), axis=0, out=self.picture)
+            if not self.frame_buffer.is_intact(sequence):
+                return False
+
+        self.blit()
+        self.name_label.draw(screen, text_renderer, dirty_rects, self.name)
+        return True
+
+    def blit(self):
+        """Copy picture of the lattice to the pane, scaling it by GRID_SCALE"""
+        surface = self.surface
+        if self.pane is not None:
+            pygame.transform.scale(surface, self.pane.get_size(), self.pane)
+            surface = self.pane
+        dirty_rects.add(screen.blit(surface, (self.x, self.y)))
+
+    def close(self):
+        """Release frame buffer"""
+        self.surface = self.pane = None
+        if self.frame_buffer is not None:
+            self.frame_buffer.unlink()
 
 
 class Chart:
@@ -139,13 +169,13 @@ class Chart:
         """
         self.sim = simulation
         self.index = sim_index
-        self.figure = pyc.Figure(
-            screen,
+        self.rect = pygame.Rect(
             self.sim.x + GRID_SIZE[0] * 2 + BETWEEN_IND[0] * 3,
             self.sim.y,
             GRID_SIZE[0],
             GRID_SIZE[1],
         )
+        self.figure = pyc.Figure(screen, *self.rect)
 
     def draw(self):
         """Draws the chart"""
@@ -173,12 +203,16 @@ class Chart:
             color=colors[0],
         )
         self.figure.draw()
+        dirty_rects.add(self.rect)
 
 
-def prepare_board():
+def prepare_board(labels=()):
     """
-    renders board
+    renders board, given labels are drawn again on their next update
     """
+    for label in labels:
+        label.reset()
+    dirty_rects.add_everything()
 
     screen.fill((255, 255, 255))
     pygame.display.flip()
@@ -339,95 +373,96 @@ def prepare_board():
     )
 
 
-def render_fps(x: int, y: int, fps_num: int):
+def render_sim_status():
     """
-    render function to render fps
+    render function for printing sim status
     """
-
-    pygame.draw.rect(
-        screen,
-        (255, 255, 255),
-        pygame.Rect(x, y, 300, 150),
-    )
-
-    screen.blit(
-        text_font.render(f"FPS: {fps_num}", False, (0, 0, 0)),
-        (x, y),
-    )
+    status = "Running" if running_sim.is_set() else "Stopped"
+    render_label("status", f"Status: {status}")
 
 
-def render_sim_status():
+def render_label(name: str, text: str):
     """
-    render function for printing sim status
+    render text of dashboard label if it has changed
     """
+    dashboard_labels[name].draw(screen, text_renderer, dirty_rects, text)
 
-    if running_sim.value:
-        render_text(
-            "Status: Running",
-            DASHBOARD_X_Y[0] + 120,
-            DASHBOARD_X_Y[1] + 5,
-            20,
-            (174, 198, 207),
-            (0, 0, 0),
-        )
-    else:
-        render_text(
-            "Status: Stopped",
-            DASHBOARD_X_Y[0] + 120,
-            DASHBOARD_X_Y[1] + 5,
-            20,
-            (174, 198, 207),
-            (0, 0, 0),
-        )      
-
-
-def step_calculator(variables, queue, active, start_x, start_y):
+
+def step_calculator(variables, queue, frame_buffer, active, stop, start_x, start_y,
+                    geometry=None):
     """
-    Calculates a steps for each process. Creates an automaton and calculates one step at a time.
-    Puts in queue: list of [coordinates of active cells with their respective color, days elapsed,
-    CellCunter(for graphs)]
+    Calculates a steps for each process. Creates an automaton and calculates one step at a time
+    while active event is set, waiting for it otherwise, until stop event is set. Puts in queue:
+    frame, days elapsed, CellCunter(for graphs). Frame is delta of changed sites, or, if frame
+    buffer is given, sequence number of the frame rendered into it. If queue is full, the oldest
+    frame is dropped, so GUI always gets the latest ones. Geometry of the grid is attached from
+    shared memory if given. Metrics of each step are written to capture/<name>/metrics.csv and
+    frames of every EXPORT_INTERVAL days are exported to capture/<name>/frames. If
+    TRAJECTORY_INTERVAL is set, trajectory is written to capture/<name>/trajectory.traj
     """
 
-    automaton = FiniteAutomaton(Grid(GRID_SIZE[1], GRID_SIZE[0]), variables)
-    automaton.grid.place_entity(TrueStemCell(proliferation_potential=variables.max_proliferation_potential), start_x, start_y)
-    if variables.immune_response:
-        automaton.grid.place_entity(ImmuneCell(), 1, 1)
-    while True:
+    automaton = create_automaton(variables, LATTICE_SIZE[1], LATTICE_SIZE[0],
+                                 geometry.attach() if geometry else None)
+    automaton.place_initial_cells(start_x, start_y)
+    # Encoder makes the grid track changed sites, which only deltas need
+    encoder = FrameEncoder(automaton.grid) if frame_buffer is None else None
+
+    directory = os.path.join("capture", variables.name)
+    os.makedirs(directory, exist_ok=True)
+    recorder = Recorder(os.path.join(directory, "metrics.csv"))
+    recorder.append(metrics_of(automaton, 0).values())
+    exporter = None
+    if EXPORT_FORMAT is not None:
+        exporter = create_exporter(EXPORT_FORMAT, os.path.join(directory, "frames"),
+                                   automaton.grid.width, automaton.grid.height,
+                                   build_palette(variables.color_delta))
+    trajectory = None
+    if TRAJECTORY_INTERVAL:
+        trajectory = TrajectoryWriter(os.path.join(directory, "trajectory"),
+                                      automaton.grid.width, automaton.grid.height,
+                                      build_palette(variables.color_delta), TRAJECTORY_INTERVAL)
+        trajectory.record(automaton.grid, 0, automaton.variables.days_elapsed)
+
+    try:
+        for step in count(1):
+            if exporter is not None:
+                exporter.export(automaton.grid, automaton.variables.days_elapsed)
+
+            active.wait()
+            if stop.is_set():
+                break
 
-        if queue.empty() and active.value:
             automaton.next()
             automaton.variables.time_step()
-            queue.put(
-                (
-                    automaton.grid.coloured_cells,
-                    automaton.variables.days_elapsed,
-                    automaton.counter,
-                )
-            )
-
-
-def render_text(
-    text: str,
-    x: int,
-    y: int,
-    font_size=20,
-    background_color=(255, 255, 255),
-    text_color=(0, 0, 0),
-):
-    rect_size_x, rect_size_y = len(text) * font_size, int(font_size * 1.5) + 1
-
-    text_font = pygame.font.SysFont("monospace", font_size, bold=True)
-
-    pygame.draw.rect(
-        screen,
-        background_color,
-        pygame.Rect(x, y, rect_size_x, rect_size_y),
-    )
-
-    screen.blit(
-        text_font.render(text, False, text_color),
-        (x, y),
-    )
+            recorder.append(metrics_of(automaton, step).values())
+            if trajectory is not None:
+                trajectory.record(automaton.grid, step, automaton.variables.days_elapsed)
+            if frame_buffer is None:
+                frame = encoder.encode()
+            else:
+                automaton.grid.render(frame_buffer.back)
+                frame = frame_buffer.publish()
+
+            item = (frame, automaton.variables.days_elapsed, automaton.counter.copy())
+            try:
+                queue.put_nowait(item)
+            except Full:
+                try:
+                    queue.get_nowait()
+                except Empty:
+                    pass
+                queue.put(item)
+                # Picture of GUI cannot be restored from deltas after a lost one
+                if encoder is not None:
+                    encoder.request_keyframe()
+    finally:
+        # Frames left in the queue are not needed by anyone
+        queue.cancel_join_thread()
+        recorder.close()
+        if exporter is not None:
+            exporter.close()
+        if trajectory is not None:
+            trajectory.close()
 
 
 SIMULATION_SIZES = [
@@ -439,96 +474,85 @@ SIMULATION_SIZES = [
 ]
 
 
-def main():
-    argument_parser = argparse.ArgumentParser(description="Cancer simulation.")
-
-    argument_parser.add_argument("config_file", type=str)
-    args = argument_parser.parse_args()
-
-    simulation_variables = read_variables(args.config_file)
+def main(config_file: str):
+    """
+    Run simulations from the config file in pygame window,
+    only the first four of them if there are more
+    """
+    simulation_variables = read_variables(config_file)[:len(SIMULATION_SIZES)]
 
     simulations = []
 
     for i, variables in enumerate(simulation_variables):
-        simulations.append(Simulation(*SIMULATION_SIZES[i], variables.name))
+        simulations.append(Simulation(*SIMULATION_SIZES[i], variables.name, variables))
 
     pygame.init()
 
     charts = [Chart(i, sim) for i, sim in enumerate(simulations)]
 
     processes = []
+    geometry = SharedGeometry(Geometry.compute(LATTICE_SIZE[1], LATTICE_SIZE[0]))
 
     for i, simulation in enumerate(simulations):
         new_process = Process(
             target=step_calculator,
             args=(simulation_variables[i],
                   simulation.queue,
+                  simulation.frame_buffer,
                   running_sim,
-                  GRID_SIZE[0] // 2,
-                  GRID_SIZE[1] // 2),
+                  stopping,
+                  LATTICE_SIZE[0] // 2,
+                  LATTICE_SIZE[1] // 2,
+                  geometry),
         )
         new_process.start()
         processes.append(new_process)
-        simulation.delete_screenshots(os.path.join("capture/", simulation.name))
 
-    prepare_board()
+    labels = [*dashboard_labels.values()] + [simulation.name_label for simulation in simulations]
+    prepare_board(labels)
 
     pygame.display.set_caption("Cancer simulation")
     run = True
 
     while run:
 
-        if all(simulation.has_frames for simulation in simulations):
-            for chart in charts:
+        # Panes are updated independently, as soon as their frames arrive
+        for simulation, chart in zip(simulations, charts):
+            if simulation.draw():
                 chart.draw()
 
-            for simulation in simulations:
-                simulation.draw()
-                simulation.capture_screenshots(os.path.join("capture/", simulation.name))
-
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
 
                 run = False
                 break 
             if event.type == pygame.KEYDOWN and event.key == pygame.K_s:
-                running_sim.value = (running_sim.value + 1) % 2
+                if running_sim.is_set():
+                    running_sim.clear()
+                else:
+                    running_sim.set()
 
             if event.type == pygame.VIDEORESIZE or event.type == pygame.VIDEOEXPOSE:
-                prepare_board()
-
-        pygame.display.update()
-        clock.tick()
-        render_text(
-            "FPS: " + str(int(clock.get_fps())),
-            DASHBOARD_X_Y[0] + 10,
-            DASHBOARD_X_Y[1] + 5,
-            20,
-            (174, 198, 207),
-            (0, 0, 0),
-        )
+                prepare_board(labels)
 
-        render_sim_status()
-
-        render_text(
-            "Days elapsed: " + str(simulations[0].days),
-            DASHBOARD_X_Y[0] + 320,
-            DASHBOARD_X_Y[1] + 5,
-            20,
-            (174, 198, 207),
-            (0, 0, 0),
-        )
+        dirty_rects.update()
+        clock.tick(GUI_FPS)
 
-        render_text(
-            "Config filename: " + str(args.config_file),
-            DASHBOARD_X_Y[0] + 540,
-            DASHBOARD_X_Y[1] + 5,
-            20,
-            (174, 198, 207),
-            (0, 0, 0),
-        )
+        render_label("fps", "FPS: " + str(int(clock.get_fps())))
+        render_sim_status()
+        render_label("days", "Days elapsed: " + str(simulations[0].days))
+        render_label("config", "Config filename: " + str(config_file))
 
+    # Workers finish their step and close their files
+    stopping.set()
+    running_sim.set()
     for process in processes:
-        process.kill()
+        process.join(STOP_TIMEOUT)
+        if process.is_alive():
+            process.kill()
+
+    geometry.unlink()
+    for simulation in simulations:
+        simulation.close()
 
     pygame.quit()
@@ -1,11 +1,20 @@
 """Entities"""
 import math
 import numpy as np
-from random import random, choice
 from .variables import Variables, LOW_PROLIFERATION_COLOR, MAX_PROLIFERATION_COLOR
 from .cell import Cell
+from .palette import STEM_CODE, NECROTIC_CODE, IMMUNE_CODE, cancer_code
 
 
+# State codes of the lattice sites (see "States" in README). Quiescent cells
+# remember whether they were stem cells, so they get two codes.
+EMPTY = 0
+CANCER = 1
+STEM = 2
+QUIESCENT = 3
+NECROTIC = 4
+IMMUNE = 5
+QUIESCENT_STEM = 6
 
 def get_chemo_death_probability(theta, k, y, variables: Variables) -> float:
     """Return probability of cell's death due to chemotherapy"""
@@ -16,13 +25,11 @@ def get_chemo_death_probability(theta, k, y, variables: Variables) -> float:
 class Entity:
     """Entity"""
 
-    __dict__ = ["cell", "neighbors", "free_neighbors", "variables"]
+    __dict__ = ["cell", "variables"]
 
     def __init__(self) -> None:
         """Initialize entity"""
         self.cell = None
-        self.neighbors = None
-        self.free_neighbors = None
         self.variables = None
 
     def next_state(self, *args, **kwargs) -> None:
@@ -32,18 +39,17 @@ class Entity:
         """Move from current cell to next"""
         self.cell.entity = None
         next_cell.entity = self
+        self.cell = next_cell
 
     def move_to_random(self) -> None:
         """Move to random free neighbor"""
-        free_neighbor = self.free_neighbors
-
         if not self.cell.entity: # cell has died
             return
 
-        if not free_neighbor:
+        cell = self.cell.get_random_free_neighbor(self.variables.rng.random())
+        if cell is None:
             return
 
-        cell = choice(free_neighbor)
         self.move_to(cell)
 
 
@@ -52,7 +58,7 @@ class BiologicalCell(Entity):
 
     ID = 1
 
-    __dict__ = ["ID", "proliferation_potential", "cell", "neighbors", "free_neighbors", "variables"]
+    __dict__ = ["ID", "proliferation_potential", "cell", "variables"]
 
     def __init__(self, *args, proliferation_potential=None, **kwargs) -> None:
         """Initialize Biological cell"""
@@ -91,17 +97,20 @@ class BiologicalCell(Entity):
 
     def proliferate(self) -> None:
         """Proliferate"""
-        free_neighbors = self.free_neighbors
-        if not free_neighbors:
+        free_cell = self.cell.get_random_free_neighbor(self.variables.rng.random())
+        if free_cell is None:
             return
 
-        free_cell = choice(free_neighbors)
-
         if self.proliferation_potential <= 0:
             self.apotose()
             return
 
-        free_cell.entity = self.replicate()
+        daughter = self.replicate()
+        daughter.variables = self.variables
+        free_cell.entity = daughter
+        # Color of the cell depends on its proliferation potential
+        if self.cell.grid.dirty_sites is not None:
+            self.cell.grid.dirty_sites.add(self.cell.index)
 
     def replicate(self) -> Entity:
         """Return daughter cell"""
@@ -118,10 +127,16 @@ class BiologicalCell(Entity):
         r, g, b =  LOW_PROLIFERATION_COLOR + self.proliferation_potential * DELTA
         return int(r), int(g), int(b)
 
+    @property
+    def palette_code(self) -> int:
+        return cancer_code(self.proliferation_potential)
+
 
 class CancerCell(BiologicalCell):
     """Cancer cell"""
 
+    STATE = CANCER
+
     def next_state(self, *random_variables) -> None:
         apotosis, proliferation, migration, theta, death, *_ = random_variables
 
@@ -169,6 +184,8 @@ class CancerCell(BiologicalCell):
 class QuiescentCell(CancerCell):
     """Quiescent cell"""
 
+    STATE = QUIESCENT
+
     def __init__(self, previous_entity, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.previous_entity = previous_entity
@@ -182,12 +199,18 @@ class QuiescentCell(CancerCell):
 
     @property
     def color(self):
-        return self.previous_entity
+        return self.previous_entity.color
+
+    @property
+    def palette_code(self) -> int:
+        return self.previous_entity.palette_code
 
 
 class NecroticCell(CancerCell):
     """Necrotic cell"""
 
+    STATE = NECROTIC
+
     def next_state(self, *args, **kwargs) -> None:
         """Necrotic cell cannot do anything"""
 
@@ -195,6 +218,10 @@ class NecroticCell(CancerCell):
     def color(self):
         return (133, 21, 21)
 
+    @property
+    def palette_code(self) -> int:
+        return NECROTIC_CODE
+
 
 class TrueStemCell(CancerCell):
     """
@@ -204,6 +231,7 @@ class TrueStemCell(CancerCell):
     """     
 
     ID = 3
+    STATE = STEM
 
     @property
     def apotisis_probability(self) -> float:
@@ -212,7 +240,7 @@ class TrueStemCell(CancerCell):
 
     def replicate(self) -> Entity:
         """Return daughter cell"""
-        new_stem_chance = random()
+        new_stem_chance = self.variables.rng.random()
         if new_stem_chance <= self.variables.pS:
             daughter = TrueStemCell(proliferation_potential=self.proliferation_potential)
         else:
@@ -226,19 +254,22 @@ class TrueStemCell(CancerCell):
     def color(self):
         return 255, 238, 0
 
+    @property
+    def palette_code(self) -> int:
+        return STEM_CODE
+
 
 class ImmuneCell(BiologicalCell):
     """Immune cell"""
 
+    STATE = IMMUNE
+
     def next_state(self, *random_values) -> None:
         *_, theta , death, cancer_cell_death_probability, immune_cell_death_probability = random_values
 
         self.move_to_random(immune_cell_death_probability)
 
-        for neighbor in self.neighbors:
-            if neighbor.empty:
-                continue
-
+        for neighbor in self.cell.occupied_neighbors:
             if isinstance(neighbor.entity, CancerCell):
                 if cancer_cell_death_probability <= self.variables.pdT:
                     neighbor.entity = None
@@ -264,12 +295,46 @@ class ImmuneCell(BiologicalCell):
         if not self.cell.entity: # cell has died
             return
 
-        if not self.free_neighbors:
+        cell = self.cell.get_random_free_neighbor(self.variables.rng.random())
+        if cell is None:
             return
 
-        cell = choice(self.free_neighbors)
-        self.move_to(cell)   
+        self.move_to(cell)
 
     @property
     def color(self):
         return 245, 91, 209
+
+    @property
+    def palette_code(self) -> int:
+        return IMMUNE_CODE
+
+
+def state_of(entity: Entity) -> tuple[int, int]:
+    """Return state code and proliferation potential of the entity"""
+    state = entity.STATE
+    potential = getattr(entity, "proliferation_potential", None)
+
+    if isinstance(entity, QuiescentCell):
+        if isinstance(entity.previous_entity, TrueStemCell):
+            state = QUIESCENT_STEM
+        potential = entity.previous_entity.proliferation_potential
+
+    return state, potential or 0
+
+
+def entity_of(state: int, potential: int) -> Entity:
+    """Return entity with given state code and proliferation potential"""
+    if state == CANCER:
+        return CancerCell(proliferation_potential=potential)
+    if state == STEM:
+        return TrueStemCell(proliferation_potential=potential)
+    if state == QUIESCENT:
+        return QuiescentCell(CancerCell(proliferation_potential=potential))
+    if state == QUIESCENT_STEM:
+        return QuiescentCell(TrueStemCell(proliferation_potential=potential))
+    if state == NECROTIC:
+        return NecroticCell()
+    if state == IMMUNE:
+        return ImmuneCell()
+    raise ValueError(f"Unknown state code {state}")
@@ -0,0 +1,251 @@
+"""Exporting frames of simulations to files"""
+
+import os
+import shutil
+import struct
+import subprocess
+import zipfile
+import zlib
+from queue import Queue
+from threading import Thread
+import numpy as np
+from .constants import EXPORT_INTERVAL, EXPORT_FPS
+
+
+# Local file header of zip entry: signature, version, flags, method, time,
+# date, crc, compressed size, size, name length, extra field length
+LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+ZIP64_EXTRA = 0x0001
+
+
+def read_entries(path: str):
+    """
+    Yield name and content of each entry of zip archive. If the archive
+    was not closed, e.g. its writer was killed, it has no central
+    directory, so entries are read from their local headers up to the
+    first incomplete one
+    """
+    try:
+        archive = zipfile.ZipFile(path)
+    except zipfile.BadZipFile:
+        archive = None
+
+    if archive is not None:
+        with archive:
+            for name in archive.namelist():
+                yield name, archive.read(name)
+        return
+
+    with open(path, "rb") as file:
+        while True:
+            header = file.read(LOCAL_HEADER.size)
+            if len(header) < LOCAL_HEADER.size:
+                return
+            (signature, _, flags, method, _, _, crc, compressed_size, _,
+             name_length, extra_length) = LOCAL_HEADER.unpack(header)
+            # Entries written with data descriptor have no sizes in the header
+            if signature != b"PK\x03\x04" or flags & 0x08:
+                return
+
+            name = file.read(name_length).decode("utf8")
+            extra = file.read(extra_length)
+            while len(extra) >= 4:
+                field, size = struct.unpack_from("<2H", extra)
+                if field == ZIP64_EXTRA and compressed_size == 0xFFFFFFFF:
+                    _, compressed_size = struct.unpack_from("<2Q", extra, 4)
+                extra = extra[4 + size:]
+
+            data = file.read(compressed_size)
+            if len(data) < compressed_size:
+                return
+            try:
+                if method == zipfile.ZIP_DEFLATED:
+                    data = zlib.decompress(data, -zlib.MAX_WBITS)
+            except zlib.error:
+                return
+            if method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED) or zlib.crc32(data) != crc:
+                return
+
+            yield name, data
+
+
+class FrameExporter:
+    """
+    Takes frames of palette codes of the grid every interval days and
+    writes them in a background thread, at most queue_size frames wait
+    for it. Subclasses define file format in open, write and finish
+    """
+
+    EXTENSION = ""
+
+    def __init__(self, path: str, width: int, height: int, palette: np.ndarray,
+                 interval=EXPORT_INTERVAL, queue_size=8, start_day=0, append=False) -> None:
+        """
+        Start exporting frames from start_day to path, extension of the
+        format is added to it. If append is set, frames exported before
+        are kept, e.g. when run is resumed from a checkpoint
+        """
+        self.path = path + self.EXTENSION
+        self.width = width
+        self.height = height
+        self.palette = palette
+        self.interval = interval
+        self.next_day = -(-start_day // interval) * interval
+        self.start_day = start_day
+        self.append = append
+
+        self.open()
+        self.frames = Queue(maxsize=queue_size)
+        self.error = None
+        self.thread = Thread(target=self.write_frames, daemon=True)
+        self.thread.start()
+
+    def export(self, grid, day: int) -> None:
+        """Pass frame of the grid to the writing thread if it is time to export it"""
+        if self.error is not None:
+            raise self.error
+        if day < self.next_day:
+            return
+
+        frame = np.empty((self.height, self.width), dtype=np.uint8)
+        grid.render(frame)
+        self.frames.put((day, frame))
+        self.next_day = (day // self.interval + 1) * self.interval
+
+    def write_frames(self) -> None:
+        """Write frames until None is received"""
+        while True:
+            item = self.frames.get()
+            if item is None:
+                return
+            if self.error is None:
+                try:
+                    self.write(*item)
+                except OSError as error:
+                    self.error = error
+
+    def close(self) -> None:
+        """Write remaining frames and close the file"""
+        self.frames.put(None)
+        self.thread.join()
+        self.finish()
+        if self.error is not None:
+            raise self.error
+
+    def open(self) -> None:
+        """Create the file"""
+
+    def write(self, day: int, frame: np.ndarray) -> None:
+        """Write frame of given day"""
+
+    def finish(self) -> None:
+        """Close the file"""
+
+
+class ArchiveExporter(FrameExporter):
+    """
+    Writes palette codes of each frame losslessly to compressed .npz
+    archive, as `day_<day>` array, and palette of the codes as `palette`.
+    When appending, frames of days before the first day to export are
+    kept, later ones are written again
+    """
+
+    EXTENSION = ".npz"
+
+    def open(self) -> None:
+        if self.append and os.path.exists(self.path):
+            self.keep_frames()
+            mode = "a"
+        else:
+            mode = "w"
+        self.archive = zipfile.ZipFile(self.path, mode, zipfile.ZIP_DEFLATED)
+        self.names = set(self.archive.namelist())
+        self.write_array("palette", self.palette)
+
+    def keep_frames(self) -> None:
+        """
+        Rewrite the archive with frames of days before the first day to export only,
+        recovering them if the archive was not closed
+        """
+        temporary = self.path + ".tmp"
+        with zipfile.ZipFile(temporary, "w", zipfile.ZIP_DEFLATED) as archive:
+            for name, data in read_entries(self.path):
+                if name.startswith("day_") and int(name[4:-4]) >= self.next_day:
+                    continue
+                with archive.open(name, "w", force_zip64=True) as file:
+                    file.write(data)
+        os.replace(temporary, self.path)
+
+    def write(self, day: int, frame: np.ndarray) -> None:
+        self.write_array(f"day_{day:05d}", frame)
+
+    def write_array(self, name: str, array: np.ndarray) -> None:
+        """Write array to the archive as .npy file, unless it is there already"""
+        if f"{name}.npy" in self.names:
+            return
+        with self.archive.open(f"{name}.npy", "w", force_zip64=True) as file:
+            np.lib.format.write_array(file, array)
+        self.names.add(f"{name}.npy")
+
+    def finish(self) -> None:
+        self.archive.close()
+
+
+class VideoExporter(FrameExporter):
+    """
+    Pipes RGB frames to ffmpeg, which encodes them to H.264 video,
+    fps frames per second. Video cannot be appended to, so when appending
+    frames go to a new video with start day in its name
+    """
+
+    EXTENSION = ".mp4"
+
+    def __init__(self, *args, fps=EXPORT_FPS, **kwargs) -> None:
+        self.fps = fps
+        super().__init__(*args, **kwargs)
+
+    def open(self) -> None:
+        if shutil.which("ffmpeg") is None:
+            raise RuntimeError("ffmpeg is needed to export video, but it is not found")
+        if self.append:
+            root, extension = os.path.splitext(self.path)
+            self.path = f"{root}_from_day_{self.start_day:05d}{extension}"
+
+        self.encoder = subprocess.Popen(
+            ["ffmpeg", "-loglevel", "error", "-y",
+             "-f", "rawvideo", "-pix_fmt", "rgb24",
+             "-s", f"{self.width}x{self.height}", "-r", str(self.fps), "-i", "-",
+             # H.264 needs even width and height
+             "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-c:v", "libx264",
+             "-pix_fmt", "yuv420p", self.path],
+            stdin=subprocess.PIPE,
+        )
+
+    def write(self, day: int, frame: np.ndarray) -> None:
+        self.encoder.stdin.write(self.palette[frame].tobytes())
+
+    def finish(self) -> None:
+        self.encoder.stdin.close()
+        if self.encoder.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed to encode {self.path}")
+
+
+EXPORTERS = {
+    "archive": ArchiveExporter,
+    "video": VideoExporter,
+}
+
+
+def create_exporter(export_format: str, path: str, width: int, height: int,
+                    palette: np.ndarray, interval=EXPORT_INTERVAL, start_day=0,
+                    append=False) -> FrameExporter:
+    """
+    Return exporter of given format writing to path with extension of
+    the format, see FrameExporter for start_day and append
+    """
+    if export_format not in EXPORTERS:
+        raise ValueError(f"Unknown export format `{export_format}`, "
+                         f"choose one of: {', '.join(EXPORTERS)}")
+
+    return EXPORTERS[export_format](path, width, height, palette, interval,
+                                    start_day=start_day, append=append)
@@ -0,0 +1,87 @@
+"""Frames of the grid shared between step worker and GUI"""
+
+import sys
+from multiprocessing import shared_memory
+import numpy as np
+from .palette import EMPTY_CODE
+
+
+class FrameBuffer:
+    """
+    Two frames of palette codes of height x width grid in shared memory,
+    written by the step worker and read by the GUI without copying. Worker
+    renders into the back frame while GUI shows the front one, then
+    publishes it by incrementing the sequence number in the header. Frame
+    with sequence number n is stored in slot n % 2. Instance is small and
+    picklable, so it can be passed to the worker process
+    """
+
+    HEADER = np.dtype(np.uint64).itemsize
+
+    def __init__(self, width: int, height: int) -> None:
+        """Allocate shared memory for the frames"""
+        self.width = width
+        self.height = height
+        self.shape = (2, height, width)
+        self._memory = shared_memory.SharedMemory(
+            create=True, size=self.HEADER + int(np.prod(self.shape))
+        )
+        self.name = self._memory.name
+        self._map()
+        self.frames[...] = EMPTY_CODE
+        self.sequence[0] = 0
+
+    def _map(self) -> None:
+        """Create views of the header and frames"""
+        self.sequence = np.ndarray((1,), np.uint64, buffer=self._memory.buf)
+        self.frames = np.ndarray(self.shape, np.uint8, buffer=self._memory.buf,
+                                 offset=self.HEADER)
+
+    def __getstate__(self) -> dict:
+        return {"width": self.width, "height": self.height,
+                "shape": self.shape, "name": self.name}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        if sys.version_info >= (3, 13):
+            self._memory = shared_memory.SharedMemory(name=self.name, track=False)
+        else:
+            self._memory = shared_memory.SharedMemory(name=self.name)
+        self._map()
+
+    @property
+    def back(self) -> np.ndarray:
+        """Return (height, width) frame to render next step into"""
+        return self.frames[(int(self.sequence[0]) + 1) % 2]
+
+    def publish(self) -> int:
+        """Make back frame the front one and return its sequence number"""
+        self.sequence[0] += 1
+        return int(self.sequence[0])
+
+    def frame(self, sequence: int) -> np.ndarray:
+        """Return (height, width) frame with given sequence number"""
+        return self.frames[sequence % 2]
+
+    @property
+    def latest(self) -> int:
+        """Return sequence number of the last published frame"""
+        return int(self.sequence[0])
+
+    def is_intact(self, sequence: int) -> bool:
+        """
+        Return True if frame with given sequence number has not been
+        overwritten. Worker starts to overwrite it after it publishes next
+        frame, so frame read by GUI is valid if it is still the latest one
+        """
+        return self.latest == sequence
+
+    def close(self) -> None:
+        """Detach from shared memory"""
+        self.sequence = self.frames = None
+        self._memory.close()
+
+    def unlink(self) -> None:
+        """Release shared memory, must be called once by the owner"""
+        self.close()
+        self._memory.unlink()
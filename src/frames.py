@@ -0,0 +1,89 @@
+"""Delta encoding of frames of the grid"""
+
+import numpy as np
+from .constants import KEYFRAME_INTERVAL
+from .palette import EMPTY_CODE
+
+
+class Frame:
+    """
+    Indices of changed sites and their new palette codes. Keyframe lists
+    all occupied sites, other sites of the picture are empty. Frames of
+    a grid are numbered consecutively
+    """
+
+    __slots__ = ("number", "sites", "codes", "keyframe")
+
+    def __init__(self, number: int, sites: np.ndarray, codes: np.ndarray,
+                 keyframe=False) -> None:
+        """Initialize frame"""
+        self.number = number
+        self.sites = sites
+        self.codes = codes
+        self.keyframe = keyframe
+
+    def __len__(self) -> int:
+        return len(self.sites)
+
+
+class FrameEncoder:
+    """Encodes each frame of the grid as difference from the previous one"""
+
+    def __init__(self, grid, keyframe_interval=KEYFRAME_INTERVAL) -> None:
+        """Initialize encoder of Grid or ArrayGrid frames"""
+        self.grid = grid
+        grid.track_dirty_sites()
+        self.keyframe_interval = keyframe_interval
+        self.frames = 0
+        self.keyframe_requested = False
+
+    def encode(self) -> Frame:
+        """Return sites changed since last frame, or keyframe"""
+        sites = self.grid.pop_dirty_sites()
+
+        keyframe = self.keyframe_requested or self.frames % self.keyframe_interval == 0
+        if keyframe:
+            sites = self.grid.occupied_indices
+            self.keyframe_requested = False
+
+        self.frames += 1
+        sites = sites.astype(np.int32)
+        return Frame(self.frames - 1, sites, self.grid.codes_of(sites), keyframe)
+
+    def request_keyframe(self) -> None:
+        """Make next frame a keyframe, e.g. if some frames were lost"""
+        self.keyframe_requested = True
+
+
+class FrameDecoder:
+    """
+    Keeps palette codes of the grid and its RGB picture up to date by
+    applying frames to them
+    """
+
+    def __init__(self, width: int, height: int, palette: np.ndarray) -> None:
+        """Initialize empty picture with colors from the palette"""
+        self.palette = palette
+        self.codes = np.full((height, width), EMPTY_CODE, dtype=np.uint8)
+        self.picture = np.empty((height, width, 3), dtype=np.uint8)
+        self.picture[...] = palette[EMPTY_CODE]
+        # Deltas are meaningless until the first keyframe and after a lost frame
+        self.synced = False
+        self.next_number = 0
+
+    def apply(self, frame: Frame) -> bool:
+        """Apply frame to the picture, return False if it was skipped"""
+        if frame.keyframe:
+            self.codes[...] = EMPTY_CODE
+            self.picture[...] = self.palette[EMPTY_CODE]
+            self.synced = True
+        elif frame.number != self.next_number:
+            self.synced = False
+        self.next_number = frame.number + 1
+
+        if not self.synced:
+            return False
+
+        self.codes.reshape(-1)[frame.sites] = frame.codes
+        self.picture.reshape(-1, 3)[frame.sites] = self.palette[frame.codes]
+        return True
@@ -1,33 +1,57 @@
 """Grid and cell"""
 
 from typing import Iterable
+from time import perf_counter
 import numpy as np
-from random import randint
-from math import sqrt
 from .cell import Cell
+from .counter import CellCounter
 from .entity import Entity
+from .lattice import Geometry, OPPOSITE_BITS, FULL_MASK, FreeSiteIndex
+from .palette import EMPTY_CODE
 
 
 class Grid:
     """Grid"""
 
-    def __init__(self, width=1000, height=1000) -> None:
+    def __init__(self, width=1000, height=1000, geometry: Geometry = None) -> None:
         """Initialize the grid"""
+        started = perf_counter()
 
         self.width = width
         self.height = height
 
+        if geometry is None:
+            geometry = Geometry.compute(width, height)
+        geometry.check_size(width, height)
+        self.geometry = geometry
+        self.distance = geometry.distance
+        self.phi = geometry.phi
+        self.neighbor_table = geometry.neighbors
+
         self.active_cells = set()
-        self.grid = [[Cell(x, y) for x in range(width)] for y in range(height)]
+        self.occupied = np.zeros((height, width), dtype=bool)
+        # Flat view of occupied, indexed as neighbor_table
+        self.occupied_sites = self.occupied.reshape(-1)
+        # Bit k is set if neighbor k of the site is occupied
+        self.neighbor_masks = np.zeros(width * height, dtype=np.uint8)
+
+        # Indices of occupied sites with an empty neighbor and
+        # sum of their distances to the center
+        self.frontier = set()
+        self.frontier_distance = 0.0
+
+        self.free_sites = FreeSiteIndex(width * height)
+
+        # Updated whenever entity of any cell is changed
+        self.counter = CellCounter()
+        # Indices of sites which color may have changed since last frame,
+        # None until changes are tracked, see track_dirty_sites
+        self.dirty_sites = None
 
-        for row in self.grid:
-            for cell in row:
-                cx, cy = self.center
-                cell.add_entity_callback = lambda c: self.add_active_cell(c)
-                cell.remove_entity_callback = lambda c: self.remove_active_cell(c)
-                cell.neighbors = self.get_neighbors_of(cell)
-                cell.distance = sqrt((cell.x - cx) ** 2 + (cell.y - cy) ** 2)
-                cell.phi = np.arctan2(cell.y - cy, cell.x - cx)
+        # Cell objects are created on first access, see cell()
+        self.sites = [None] * (width * height)
+
+        self.build_time = perf_counter() - started
 
     @property
     def center(self) -> tuple[int, int]:
@@ -43,27 +67,105 @@ class Grid:
     def coloured_cells(self) -> Iterable:
         return [(cell.x, cell.y, cell.entity.color) for cell in self.active_cells]
 
+    def render(self, frame: np.ndarray) -> None:
+        """Write palette code of each site into (height, width) frame"""
+        frame[...] = EMPTY_CODE
+        for cell in self.active_cells:
+            frame[cell.y, cell.x] = cell.entity.palette_code
+
+    @property
+    def occupied_indices(self) -> np.ndarray:
+        """Return indices of occupied sites"""
+        return np.flatnonzero(self.occupied_sites)
+
+    def codes_of(self, sites: np.ndarray) -> np.ndarray:
+        """Return palette codes of the sites"""
+        codes = np.full(len(sites), EMPTY_CODE, dtype=np.uint8)
+        for i, site in enumerate(sites.tolist()):
+            cell = self.sites[site]
+            if cell is not None and cell.entity is not None:
+                codes[i] = cell.entity.palette_code
+        return codes
+
+    def track_dirty_sites(self) -> None:
+        """Start tracking sites changed since last frame"""
+        if self.dirty_sites is None:
+            self.dirty_sites = set()
+
+    def pop_dirty_sites(self) -> np.ndarray:
+        """Return indices of sites changed since last call"""
+        sites = np.fromiter(self.dirty_sites, dtype=np.int32, count=len(self.dirty_sites))
+        self.dirty_sites.clear()
+        return sites
+
+    def cell(self, index: int) -> Cell:
+        """Return cell of the site by index, creating it on first access"""
+        cell = self.sites[index]
+        if cell is None:
+            y, x = divmod(int(index), self.width)
+            cell = self.sites[index] = Cell(x, y, index=int(index), grid=self)
+        return cell
+
+    def cell_at(self, x: int, y: int) -> Cell:
+        """Return cell by coordinates"""
+        return self.cell((y % self.height) * self.width + x % self.width)
+
     def add_active_cell(self, cell: Cell) -> None:
         """Add active cell"""
         self.active_cells.add(cell)
+        if not self.occupied_sites[cell.index]:
+            self.occupied_sites[cell.index] = True
+            self.free_sites.remove(cell.index)
+            self.neighbor_masks[self.neighbor_table[cell.index]] |= OPPOSITE_BITS
+            self.update_frontier(cell.index)
 
     def remove_active_cell(self, cell: Cell) -> None:
-        """Add active cell"""
+        """Remove active cell"""
         self.active_cells.remove(cell)
+        self.occupied_sites[cell.index] = False
+        self.free_sites.add(cell.index)
+        self.neighbor_masks[self.neighbor_table[cell.index]] &= ~OPPOSITE_BITS
+        self.update_frontier(cell.index)
+
+    def update_frontier(self, index: int) -> None:
+        """Update frontier membership of the site and its neighbors"""
+        for site in (index, *self.neighbor_table[index].tolist()):
+            on_frontier = self.occupied_sites[site] and self.neighbor_masks[site] != FULL_MASK
+
+            if on_frontier and site not in self.frontier:
+                self.frontier.add(site)
+                self.frontier_distance += self.distance[site]
+            elif not on_frontier and site in self.frontier:
+                self.frontier.remove(site)
+                self.frontier_distance -= self.distance[site]
+
+    @property
+    def tumor_radius(self) -> float:
+        """Return mean distance of the frontier from the center"""
+        if not self.frontier:
+            return 0
+        return self.frontier_distance // len(self.frontier)
 
     def place_entity(self, entity: Entity, x: int, y: int) -> None:
         """Place entity on grid by coordinates"""
         if not -self.width < x < self.width or not -self.height < y < self.height:
             raise ValueError("You cannot put an entity outside the boundaries")
 
-        self.grid[y][x].entity = entity
-        self.add_active_cell(self.grid[y][x])
+        self.cell_at(x, y).entity = entity
+
+    def clear(self) -> None:
+        """Remove all entities from the grid"""
+        for cell in list(self.active_cells):
+            cell.entity = None
 
     def to_array(self) -> list[list[int]]:
         """
         Convert list of Cell objects to list of int
         """
-        return [[cell.entity_id for cell in row] for row in self.grid]
+        ids = np.zeros(self.width * self.height, dtype=int)
+        for cell in self.active_cells:
+            ids[cell.index] = cell.entity_id
+        return ids.reshape(self.height, self.width).tolist()
 
     def get_neighbors_of(self, cell: Cell) -> list[Cell]:
         """
@@ -71,22 +173,13 @@ class Grid:
         in the grid
         """
 
-        neighbors = []
-        for dx in range(-1, 2):
-            for dy in range(-1, 2):
-                if dx == dy == 0:
-                    continue
-
-                x = (cell.x + dx) % self.width
-                y = (cell.y + dy) % self.height
-
-                neighbors.append(self.grid[y][x])
+        return cell.neighbors
 
-        return neighbors
+    def get_random_free_cell(self, rng: np.random.Generator) -> Cell:
+        """Return random free cell or None if the grid is full"""
+        cells = self.get_random_free_cells(1, rng)
+        return cells[0] if cells else None
 
-    def get_random_free_cell(self) -> Cell:
-        """Return random free cell"""
-        x, y = randint(0, self.width - 1), randint(0, self.height - 1)
-        while not self.grid[x][y].empty:
-            x, y = randint(0, self.width - 1), randint(0, self.height - 1)
-        return self.grid[x][y]
+    def get_random_free_cells(self, count: int, rng: np.random.Generator) -> list[Cell]:
+        """Return up to count distinct random free cells"""
+        return [self.cell(i) for i in self.free_sites.sample(rng.random(count))]
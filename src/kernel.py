@@ -0,0 +1,182 @@
+"""
+Step kernel of the array engine. Compiled with numba if it is installed,
+otherwise the same functions run as plain Python
+"""
+
+from .entity import EMPTY, CANCER, STEM, QUIESCENT, NECROTIC, IMMUNE, QUIESCENT_STEM
+
+try:
+    from numba import njit
+
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        """Return function unchanged"""
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda function: function
+
+
+@njit(cache=True)
+def random_free_neighbor(state, neighbors, site, random_value):
+    """Return random empty neighbor of the site or -1 if there is none"""
+    count = 0
+    for k in range(8):
+        if state[neighbors[site, k]] == EMPTY:
+            count += 1
+
+    if count == 0:
+        return -1
+
+    chosen = int(random_value * count)
+    for k in range(8):
+        neighbor = neighbors[site, k]
+        if state[neighbor] == EMPTY:
+            if chosen == 0:
+                return neighbor
+            chosen -= 1
+    return -1
+
+
+@njit(cache=True)
+def set_state(state, counts, site, new_state):
+    """Change state code of the site keeping counts of states"""
+    counts[state[site]] -= 1
+    counts[new_state] += 1
+    state[site] = new_state
+
+
+@njit(cache=True)
+def remove(state, potential, energy, counts, site):
+    """Make site empty"""
+    set_state(state, counts, site, EMPTY)
+    potential[site] = 0
+    energy[site] = 0
+
+
+@njit(cache=True)
+def move(state, potential, energy, counts, acted, site, target):
+    """Move occupant of the site to the target site"""
+    set_state(state, counts, target, state[site])
+    potential[target] = potential[site]
+    energy[target] = energy[site]
+    remove(state, potential, energy, counts, site)
+    acted[target] = True
+
+
+@njit(cache=True)
+def next_cancer_state(state, potential, energy, counts, distance, acted, neighbors,
+                      site, random_values, pA, p0, growth_radius, pS, mu,
+                      quiescent_distance, necrotic_distance, is_treatment,
+                      chemo_scale, kPC, yPC):
+    """Rules of CancerCell and TrueStemCell"""
+    stem = state[site] == STEM
+
+    if not stem and random_values[0] <= pA:
+        remove(state, potential, energy, counts, site)
+        return
+
+    if random_values[1] <= p0 * (1 - distance[site] / growth_radius):
+        target = random_free_neighbor(state, neighbors, site, random_values[5])
+        if target >= 0:
+            if potential[site] <= 0:
+                remove(state, potential, energy, counts, site)
+                return
+
+            if not stem:
+                daughter = CANCER
+                potential[site] -= 1
+            elif random_values[6] <= pS:
+                daughter = STEM
+            else:
+                daughter = CANCER
+
+            set_state(state, counts, target, daughter)
+            potential[target] = potential[site]
+            energy[target] = 0
+            acted[target] = True
+
+    if random_values[2] <= mu:
+        target = random_free_neighbor(state, neighbors, site, random_values[7])
+        if target >= 0:
+            move(state, potential, energy, counts, acted, site, target)
+            site = target
+
+    if not stem and is_treatment:
+        if random_values[4] <= kPC * chemo_scale / (random_values[3] * yPC + 1):
+            remove(state, potential, energy, counts, site)
+            return
+
+    if energy[site] >= quiescent_distance:
+        set_state(state, counts, site, QUIESCENT_STEM if stem else QUIESCENT)
+
+    if energy[site] >= necrotic_distance:
+        set_state(state, counts, site, NECROTIC)
+
+
+@njit(cache=True)
+def next_quiescent_state(state, energy, counts, site, quiescent_distance, necrotic_distance):
+    """Rules of QuiescentCell"""
+    if energy[site] < quiescent_distance:
+        set_state(state, counts, site, STEM if state[site] == QUIESCENT_STEM else CANCER)
+
+    if energy[site] > necrotic_distance:
+        set_state(state, counts, site, NECROTIC)
+
+
+@njit(cache=True)
+def next_immune_state(state, potential, energy, counts, acted, neighbors, site,
+                      random_values, pdT, pdI, is_treatment, chemo_scale, kI, yI):
+    """Rules of ImmuneCell"""
+    target = random_free_neighbor(state, neighbors, site, random_values[7])
+    if target >= 0:
+        move(state, potential, energy, counts, acted, site, target)
+        site = target
+
+    for k in range(8):
+        neighbor = neighbors[site, k]
+        if state[neighbor] == EMPTY or state[neighbor] == IMMUNE:
+            continue
+
+        if random_values[3] <= pdT:
+            remove(state, potential, energy, counts, neighbor)
+
+        if random_values[4] <= pdI:
+            remove(state, potential, energy, counts, site)
+            return
+
+        break
+
+    if is_treatment:
+        if random_values[2] <= kI * chemo_scale / (random_values[1] * yI + 1):
+            remove(state, potential, energy, counts, site)
+
+
+@njit(cache=True)
+def step_kernel(state, potential, energy, counts, distance, acted, neighbors,
+                sites, random_variables, pA, p0, growth_radius, pS, mu, pdT, pdI,
+                quiescent_distance, necrotic_distance, is_treatment,
+                chemo_scale, kPC, yPC, kI, yI):
+    """
+    Apply transition rules to each of the given sites in order.
+    yPC and yI must be already multiplied by the number of injections
+    """
+    for i in range(len(sites)):
+        site = sites[i]
+        if acted[site]:
+            continue
+
+        site_state = state[site]
+        if site_state == CANCER or site_state == STEM:
+            next_cancer_state(state, potential, energy, counts, distance, acted, neighbors,
+                              site, random_variables[i], pA, p0, growth_radius, pS, mu,
+                              quiescent_distance, necrotic_distance, is_treatment,
+                              chemo_scale, kPC, yPC)
+        elif site_state == QUIESCENT or site_state == QUIESCENT_STEM:
+            next_quiescent_state(state, energy, counts, site, quiescent_distance, necrotic_distance)
+        elif site_state == IMMUNE:
+            next_immune_state(state, potential, energy, counts, acted, neighbors, site,
+                              random_variables[i], pdT, pdI, is_treatment,
+                              chemo_scale, kI, yI)
@@ -0,0 +1,202 @@
+"""Geometry of the lattice and bookkeeping of its sites"""
+
+import sys
+from multiprocessing import shared_memory
+import numpy as np
+
+
+# Same order of neighbors as in Grid.get_neighbors_of
+NEIGHBOR_OFFSETS = [(dx, dy) for dx in range(-1, 2) for dy in range(-1, 2) if dx or dy]
+
+
+def erode(region: np.ndarray) -> np.ndarray:
+    """
+    Return sites of the region all neighbors of which are in the
+    region as well. Lattice is toroidal, last two axes are y and x
+    """
+    inner = region.copy()
+    for dx, dy in NEIGHBOR_OFFSETS:
+        inner &= np.roll(region, (-dy, -dx), axis=(-2, -1))
+    return inner
+
+
+def distance_to_edge(occupied: np.ndarray, limit: int) -> np.ndarray:
+    """
+    Return distance from each occupied site to the nearest occupied
+    site with an empty neighbor, which itself has distance 0. This is the
+    fixed point of "minimal energy of the neighbors plus one" rule.
+    Distance is computed by multi-source BFS from the empty sites, one
+    erosion of the occupied region per BFS layer, and is capped at limit
+    """
+    distance = np.zeros(occupied.shape, dtype=np.int32)
+    inner = occupied
+    for _ in range(limit):
+        inner = erode(inner)
+        if not inner.any():
+            break
+        distance += inner
+    return distance
+
+
+def neighbor_table(width: int, height: int) -> np.ndarray:
+    """
+    Return (width * height, 8) table of indices of the neighbors of
+    each site (x, y) with index y * width + x, on the toroidal lattice
+    """
+    y, x = np.divmod(np.arange(width * height, dtype=np.int32), np.int32(width))
+    table = np.empty((width * height, 8), dtype=np.int32)
+    for k, (dx, dy) in enumerate(NEIGHBOR_OFFSETS):
+        table[:, k] = ((y + dy) % height) * width + (x + dx) % width
+    return table
+
+
+# Neighbor masks have bit k set if neighbor k of the site is occupied.
+# Site is neighbor 7 - k of its neighbor k
+OPPOSITE_BITS = np.array([1 << (7 - k) for k in range(8)], dtype=np.uint8)
+FULL_MASK = 0xFF
+
+# Directions of empty neighbors for each neighbor mask
+FREE_DIRECTIONS = [tuple(k for k in range(8) if not mask >> k & 1) for mask in range(256)]
+
+
+class FreeSiteIndex:
+    """
+    Set of empty sites with O(1) insertion, removal and uniform
+    sampling. Empty sites are packed into the first count items of
+    sites, position holds place of each site there or -1
+    """
+
+    def __init__(self, size: int) -> None:
+        """Initialize index with all sites empty"""
+        self.sites = np.arange(size, dtype=np.int32)
+        self.position = np.arange(size, dtype=np.int32)
+        self.count = size
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __contains__(self, site: int) -> bool:
+        return self.position[site] >= 0
+
+    def add(self, site: int) -> None:
+        """Mark site as empty"""
+        if self.position[site] >= 0:
+            return
+        self.sites[self.count] = site
+        self.position[site] = self.count
+        self.count += 1
+
+    def remove(self, site: int) -> None:
+        """Mark site as occupied"""
+        place = self.position[site]
+        if place < 0:
+            return
+        self.count -= 1
+        last = self.sites[self.count]
+        self.sites[place] = last
+        self.position[last] = place
+        self.position[site] = -1
+
+    def sample(self, random_values: np.ndarray) -> np.ndarray:
+        """
+        Return distinct empty sites chosen uniformly, one for each of
+        random values from [0, 1), or all of them if there are fewer.
+        Sites stay in the index
+        """
+        count = min(len(random_values), self.count)
+        for i in range(count):
+            j = i + int(random_values[i] * (self.count - i))
+            site_i, site_j = self.sites[i], self.sites[j]
+            self.sites[i], self.sites[j] = site_j, site_i
+            self.position[site_j], self.position[site_i] = i, j
+        return self.sites[:count].copy()
+
+
+class Geometry:
+    """
+    Static geometry of the width x height lattice: distance and
+    angle of each site from the center and table of its neighbors
+    """
+
+    def __init__(self, width: int, height: int, distance: np.ndarray,
+                 phi: np.ndarray, neighbors: np.ndarray) -> None:
+        """Initialize geometry from precomputed arrays"""
+        self.width = width
+        self.height = height
+        self.distance = distance
+        self.phi = phi
+        self.neighbors = neighbors
+
+    @classmethod
+    def compute(cls, width: int, height: int) -> "Geometry":
+        """Return geometry of the lattice computed in one vectorized pass"""
+        cx, cy = width // 2, height // 2
+        y, x = np.divmod(np.arange(width * height), width)
+        return cls(
+            width,
+            height,
+            np.sqrt((x - cx) ** 2 + (y - cy) ** 2),
+            np.arctan2(y - cy, x - cx),
+            neighbor_table(width, height),
+        )
+
+    def check_size(self, width: int, height: int) -> None:
+        """Raise ValueError if geometry is computed for other lattice size"""
+        if (self.width, self.height) != (width, height):
+            raise ValueError(f"Geometry of {self.width}x{self.height} lattice "
+                             f"cannot be used for {width}x{height} grid")
+
+
+class SharedGeometry:
+    """
+    Geometry published in shared memory by the parent process.
+    Instance is small and picklable, so it can be passed to worker
+    processes that attach to the same arrays without copying
+    """
+
+    FIELDS = ("distance", "phi", "neighbors")
+
+    def __init__(self, geometry: Geometry) -> None:
+        """Copy arrays of the geometry to shared memory"""
+        self.width = geometry.width
+        self.height = geometry.height
+        self.specs = {}
+        self._memory = []
+
+        for field in self.FIELDS:
+            array = getattr(geometry, field)
+            memory = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, array.dtype, buffer=memory.buf)[...] = array
+            self.specs[field] = (memory.name, array.shape, array.dtype.str)
+            self._memory.append(memory)
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state["_memory"] = []
+        return state
+
+    def attach(self) -> Geometry:
+        """Return read-only geometry backed by the shared memory"""
+        arrays = {}
+        memory = []
+        for field, (name, shape, dtype) in self.specs.items():
+            if sys.version_info >= (3, 13):
+                block = shared_memory.SharedMemory(name=name, track=False)
+            else:
+                block = shared_memory.SharedMemory(name=name)
+            array = np.ndarray(shape, dtype, buffer=block.buf)
+            array.flags.writeable = False
+            arrays[field] = array
+            memory.append(block)
+
+        geometry = Geometry(self.width, self.height, **arrays)
+        # Keep blocks alive while geometry is in use
+        geometry.shared_memory = memory
+        return geometry
+
+    def unlink(self) -> None:
+        """Release shared memory, must be called once by the owner"""
+        for memory in self._memory:
+            memory.close()
+            memory.unlink()
+        self._memory = []
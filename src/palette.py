@@ -0,0 +1,48 @@
+"""
+Palette of frames. Each site of a frame is one byte, palette code,
+and palette maps codes to RGB colors
+"""
+
+import numpy as np
+from .variables import LOW_PROLIFERATION_COLOR, MAX_PROLIFERATION_COLOR
+
+
+EMPTY_CODE = 0
+STEM_CODE = 1
+NECROTIC_CODE = 2
+IMMUNE_CODE = 3
+# Cancer cell with proliferation potential p has code CANCER_CODE + p
+CANCER_CODE = 4
+MAX_POTENTIAL_CODE = 255 - CANCER_CODE
+
+CODE_COLORS = {
+    EMPTY_CODE: (255, 255, 255),
+    STEM_CODE: (255, 238, 0),
+    NECROTIC_CODE: (133, 21, 21),
+    IMMUNE_CODE: (245, 91, 209),
+}
+
+
+def cancer_code(proliferation_potential: int) -> int:
+    """Return palette code of cancer cell with given proliferation potential"""
+    return CANCER_CODE + min(max(proliferation_potential or 0, 0), MAX_POTENTIAL_CODE)
+
+
+def build_palette(color_delta: np.ndarray = None) -> np.ndarray:
+    """
+    Return (256, 3) table of RGB colors of palette codes. Colors of cancer
+    cells grow by color_delta with proliferation potential, all of them
+    have maximal proliferation color if it is not given
+    """
+    palette = np.zeros((256, 3), dtype=np.uint8)
+    for code, color in CODE_COLORS.items():
+        palette[code] = color
+
+    potential = np.arange(MAX_POTENTIAL_CODE + 1)[:, None]
+    if color_delta is None:
+        palette[CANCER_CODE:] = MAX_PROLIFERATION_COLOR
+    else:
+        palette[CANCER_CODE:] = np.clip(
+            LOW_PROLIFERATION_COLOR + potential * color_delta, 0, 255
+        ).astype(np.uint8)
+    return palette
@@ -0,0 +1,150 @@
+"""Recording metrics of automata step by step"""
+
+import csv
+from queue import Queue
+from threading import Thread
+from time import monotonic
+from typing import Iterable
+import numpy as np
+
+
+METRICS = (
+    "step",
+    "days_elapsed",
+    "immune_cell",
+    "tumor_cell",
+    "proliferating_cell",
+    "stem_cell",
+    "Rt",
+    "is_treatment",
+)
+METRIC_TYPES = dict.fromkeys(METRICS, np.int64) | {"Rt": np.float64}
+
+CHUNK_SIZE = 1024
+FLUSH_INTERVAL = 1.0
+
+
+def metrics_of(automaton, step: int) -> dict:
+    """Return metrics of the automaton after given step"""
+    counter = automaton.counter
+    return {
+        "step": step,
+        "days_elapsed": automaton.variables.days_elapsed,
+        "immune_cell": counter.immune_cell,
+        "tumor_cell": counter.tumor_cell,
+        "proliferating_cell": counter.proliferating_cell,
+        "stem_cell": counter.stem_cell,
+        "Rt": automaton.variables.Rt,
+        "is_treatment": int(automaton.variables.is_treatment),
+    }
+
+
+def truncate_rows(path: str, step: int) -> None:
+    """
+    Remove rows of csv file of metrics from given step on, along with
+    incomplete last row, keeping the file in place
+    """
+    with open(path, "r+b") as file:
+        file.readline()
+        end = file.tell()
+        for line in iter(file.readline, b""):
+            if not line.endswith(b"\n") or int(line.split(b",", 1)[0]) >= step:
+                break
+            end = file.tell()
+        file.truncate(end)
+
+
+class Recorder:
+    """
+    Appends rows to a chunk of preallocated column arrays and writes
+    chunks to csv file in a background thread. Chunk is handed over to the
+    thread when it is full or flush_interval seconds after its first row,
+    and at most two chunks wait for the thread, so memory is bounded
+    however long the run is
+    """
+
+    def __init__(self, path: str, columns: dict = None, chunk_size=CHUNK_SIZE,
+                 flush_interval=FLUSH_INTERVAL, append=False) -> None:
+        """
+        Create csv file with given columns, mapping names to dtypes, or
+        append rows to existing one if append is set
+        """
+        self.path = path
+        self.columns = METRIC_TYPES if columns is None else columns
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval
+
+        self.file = open(path, "a" if append else "w", newline="", encoding="utf8")
+        self.writer = csv.writer(self.file)
+        if not append:
+            self.writer.writerow(self.columns)
+
+        self.chunks = Queue(maxsize=2)
+        self.error = None
+        self.thread = Thread(target=self.write_chunks, daemon=True)
+        self.thread.start()
+        self.new_chunk()
+
+    def new_chunk(self) -> None:
+        """Allocate empty chunk"""
+        self.chunk = [np.empty(self.chunk_size, dtype) for dtype in self.columns.values()]
+        self.filled = 0
+        self.started = None
+
+    def append(self, values: Iterable) -> None:
+        """Append row with value of each column"""
+        if self.error is not None:
+            raise self.error
+
+        for column, value in zip(self.chunk, values):
+            column[self.filled] = value
+        self.filled += 1
+
+        if self.started is None:
+            self.started = monotonic()
+        if self.filled == self.chunk_size or monotonic() - self.started >= self.flush_interval:
+            self.hand_over()
+
+    def hand_over(self) -> None:
+        """Pass filled part of the chunk to the writing thread"""
+        if self.filled:
+            self.chunks.put((self.chunk, self.filled))
+            self.new_chunk()
+
+    def write_chunks(self) -> None:
+        """Write chunks to the file until None is received"""
+        while True:
+            item = self.chunks.get()
+            try:
+                if item is None:
+                    return
+                if self.error is None:
+                    chunk, filled = item
+                    self.writer.writerows(zip(*(column[:filled].tolist() for column in chunk)))
+                    self.file.flush()
+            except OSError as error:
+                self.error = error
+            finally:
+                self.chunks.task_done()
+
+    def flush(self) -> None:
+        """Write all appended rows to the file"""
+        self.hand_over()
+        self.chunks.join()
+        if self.error is not None:
+            raise self.error
+
+    def close(self) -> None:
+        """Write all appended rows and close the file"""
+        self.hand_over()
+        self.chunks.put(None)
+        self.thread.join()
+        self.file.close()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self) -> "Recorder":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
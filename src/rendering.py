@@ -0,0 +1,95 @@
+"""Cached text rendering and partial screen updates of the GUI"""
+
+import pygame
+
+
+class TextRenderer:
+    """Renders text, caching fonts and rendered surfaces"""
+
+    MAX_SURFACES = 512
+
+    def __init__(self, name="monospace", bold=True) -> None:
+        """Initialize renderer of the font family"""
+        self.name = name
+        self.bold = bold
+        self.fonts = {}
+        self.surfaces = {}
+
+    def font(self, size: int) -> pygame.font.Font:
+        """Return font of given size, created on first use"""
+        if size not in self.fonts:
+            self.fonts[size] = pygame.font.SysFont(self.name, size, bold=self.bold)
+        return self.fonts[size]
+
+    def render(self, text: str, size: int, color=(0, 0, 0)) -> pygame.Surface:
+        """Return surface with the text, rendered on first use"""
+        key = (text, size, color)
+        if key not in self.surfaces:
+            if len(self.surfaces) >= self.MAX_SURFACES:
+                self.surfaces.clear()
+            self.surfaces[key] = self.font(size).render(text, False, color)
+        return self.surfaces[key]
+
+
+class DirtyRects:
+    """Regions of the screen changed since the last display update"""
+
+    def __init__(self) -> None:
+        """Initialize empty list of regions"""
+        self.rects = []
+        self.everything = False
+
+    def add(self, rect: pygame.Rect) -> None:
+        """Mark region as changed"""
+        self.rects.append(pygame.Rect(rect))
+
+    def add_everything(self) -> None:
+        """Mark the whole screen as changed"""
+        self.everything = True
+
+    def update(self) -> None:
+        """Update changed regions of the display"""
+        if self.everything:
+            pygame.display.update()
+        elif self.rects:
+            pygame.display.update(self.rects)
+        self.rects = []
+        self.everything = False
+
+
+class Label:
+    """Line of text at fixed position, redrawn only when it changes"""
+
+    def __init__(self, x: int, y: int, font_size=20, background_color=(255, 255, 255),
+                 text_color=(0, 0, 0)) -> None:
+        """Initialize empty label"""
+        self.x = x
+        self.y = y
+        self.font_size = font_size
+        self.background_color = background_color
+        self.text_color = text_color
+        self.text = None
+        self.rect = None
+
+    def draw(self, screen: pygame.Surface, renderer: TextRenderer, dirty: DirtyRects,
+             text: str) -> None:
+        """Draw text if it differs from the one on the screen"""
+        if text == self.text:
+            return
+
+        surface = renderer.render(text, self.font_size, self.text_color)
+        rect = surface.get_rect(topleft=(self.x, self.y))
+        if self.rect is not None:
+            screen.fill(self.background_color, self.rect)
+            dirty.add(self.rect)
+        screen.fill(self.background_color, rect)
+        screen.blit(surface, rect)
+        dirty.add(rect)
+
+        self.text = text
+        self.rect = rect
+
+    def reset(self) -> None:
+        """Forget drawn text, e.g. after the screen was cleared"""
+        self.text = None
+        self.rect = None
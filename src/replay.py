@@ -0,0 +1,85 @@
+"""Replay of trajectory files in pygame window"""
+
+import pygame
+from .constants import GUI_FPS, REPLAY_FPS
+from .rendering import TextRenderer, DirtyRects, Label
+from .trajectory import Trajectory
+
+
+STATUS_HEIGHT = 30
+STATUS_COLOR = (174, 198, 207)
+MIN_WIDTH = 600
+
+# Number of frames or days each key moves by
+FRAME_KEYS = {pygame.K_LEFT: -1, pygame.K_RIGHT: 1, pygame.K_DOWN: -10, pygame.K_UP: 10}
+DAY_KEYS = {pygame.K_PAGEDOWN: -10, pygame.K_PAGEUP: 10}
+
+
+def main(path: str, scale=1):
+    """
+    Show frames of the trajectory file one at a time. Left and right arrows
+    move by one frame, down and up by ten, page down and page up by ten
+    days, home and end go to the first and last frame, space starts and
+    stops playback at REPLAY_FPS frames per second. Only shown frames are
+    read from the file, and end shows frames written since it was opened
+    """
+    trajectory = Trajectory(path)
+    if not len(trajectory):
+        raise ValueError(f"{path} has no frames")
+
+    pygame.init()
+    size = trajectory.width * scale, trajectory.height * scale
+    screen = pygame.display.set_mode((max(size[0], MIN_WIDTH), size[1] + STATUS_HEIGHT))
+    pygame.display.set_caption(f"Cancer simulation replay: {path}")
+    screen.fill(STATUS_COLOR)
+
+    clock = pygame.time.Clock()
+    text_renderer = TextRenderer()
+    dirty_rects = DirtyRects()
+    dirty_rects.add_everything()
+    status = Label(10, size[1] + 5, 20, STATUS_COLOR)
+
+    current, shown = 0, None
+    playing = False
+    elapsed = 0
+
+    run = True
+    while run:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                run = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key in FRAME_KEYS:
+                    current += FRAME_KEYS[event.key]
+                elif event.key in DAY_KEYS:
+                    day = trajectory.day(current) + DAY_KEYS[event.key]
+                    current = trajectory.find_day(day)
+                elif event.key == pygame.K_HOME:
+                    current = 0
+                elif event.key == pygame.K_END:
+                    trajectory.refresh()
+                    current = len(trajectory) - 1
+                elif event.key == pygame.K_SPACE:
+                    playing = not playing
+
+        elapsed += clock.tick(GUI_FPS)
+        if playing and elapsed >= 1000 / REPLAY_FPS:
+            elapsed = 0
+            current += 1
+        current = min(max(current, 0), len(trajectory) - 1)
+        playing = playing and current < len(trajectory) - 1
+
+        if current != shown:
+            picture = pygame.image.frombuffer(trajectory.picture(current).tobytes(),
+                                              (trajectory.width, trajectory.height), "RGB")
+            if scale != 1:
+                picture = pygame.transform.scale(picture, size)
+            dirty_rects.add(screen.blit(picture, (0, 0)))
+            shown = current
+
+        status.draw(screen, text_renderer, dirty_rects,
+                    f"Day {trajectory.day(current)}  step {trajectory.step(current)}  "
+                    f"frame {current + 1}/{len(trajectory)}" + ("  playing" if playing else ""))
+        dirty_rects.update()
+
+    pygame.quit()
@@ -0,0 +1,333 @@
+"""Running simulations without GUI"""
+
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from .aggregation import OnlineStatistics
+from .automaton import FiniteAutomaton, create_automaton
+from .batch import BatchAutomaton
+from .constants import EXPORT_INTERVAL
+from .export import create_exporter
+from .lattice import Geometry, SharedGeometry
+from .palette import build_palette
+from .recorder import METRICS, Recorder, metrics_of, truncate_rows
+from .trajectory import TrajectoryWriter
+from .variables import Variables
+
+
+def create_simulation(variables: Variables, width: int, height: int,
+                      geometry: Geometry = None) -> FiniteAutomaton:
+    """Return automaton with initial cells placed in the center of the grid"""
+    automaton = create_automaton(variables, width, height, geometry)
+    automaton.place_initial_cells(width // 2, height // 2)
+    return automaton
+
+
+def run_simulation(variables: Variables, steps: int, width: int, height: int,
+                   output_dir: str, shared_geometry: SharedGeometry = None,
+                   checkpoint_every: int = None, resume=False, trunk: str = None,
+                   export: str = None, export_every=EXPORT_INTERVAL,
+                   trajectory_every: int = None) -> dict:
+    """
+    Make given number of steps, write metrics of each step to
+    <output_dir>/<name>.csv and return summary: swept parameters
+    and metrics of the last step. Every checkpoint_every steps and after
+    the last one automaton is saved to <output_dir>/<name>.npz, and if
+    resume is set, run continues from this checkpoint if it exists, and
+    it must not be made after more than given number of steps.
+    If trunk is given, run continues from checkpoint of another
+    simulation, <trunk>.npz, and its metrics from <trunk>.csv. If export
+    format is given, frames of every export_every days are exported to
+    <output_dir>/<name>_frames. If trajectory_every is given, frame of
+    every trajectory_every steps is appended to <output_dir>/<name>.traj
+    """
+    geometry = shared_geometry.attach() if shared_geometry else None
+    automaton = create_simulation(variables, width, height, geometry)
+
+    name = os.path.join(output_dir, variables.name)
+    path, checkpoint_path = f"{name}.csv", f"{name}.npz"
+
+    resuming = resume and os.path.exists(checkpoint_path)
+    if resuming:
+        trunk = name
+
+    rows = []
+    start = 0
+    if trunk is not None:
+        automaton.load(f"{trunk}.npz")
+        start = variables.time // variables.time_delta
+    if start > steps:
+        raise ValueError(f"Checkpoint of {variables.name} is made after {start} steps, "
+                         f"run must be at least that long, not {steps} steps")
+
+    # Rows written after the checkpoint are made again. If metrics are
+    # lost, they are written anew from the checkpoint
+    append_rows = resuming and os.path.exists(path)
+    if append_rows:
+        truncate_rows(path, start)
+    elif trunk is not None and not resuming:
+        with open(f"{trunk}.csv", newline="", encoding="utf8") as file:
+            rows = [row for row in csv.DictReader(file) if int(row["step"]) < start]
+
+    metrics = metrics_of(automaton, start)
+
+    exporter = None
+    if export is not None:
+        start_day = variables.days_elapsed
+        if resuming:
+            # Frames of days reached before the checkpoint step were exported already
+            start_day = (variables.time - variables.time_delta) // 24 + 1
+        exporter = create_exporter(export, f"{name}_frames", width, height,
+                                   build_palette(variables.color_delta), export_every,
+                                   start_day=start_day, append=resuming)
+    trajectory = None
+    if trajectory_every:
+        trajectory = TrajectoryWriter(name, width, height, build_palette(variables.color_delta),
+                                      trajectory_every, start if resuming else None)
+        trajectory.record(automaton.grid, start, variables.days_elapsed)
+
+    with Recorder(path, append=append_rows) as recorder:
+        for row in rows:
+            recorder.append(float(row[metric]) for metric in METRICS)
+        recorder.append(metrics.values())
+
+        for step in range(start + 1, steps + 1):
+            if exporter is not None:
+                exporter.export(automaton.grid, variables.days_elapsed)
+
+            automaton.next()
+            metrics = metrics_of(automaton, step)
+            recorder.append(metrics.values())
+            if trajectory is not None:
+                trajectory.record(automaton.grid, step, variables.days_elapsed)
+
+            if checkpoint_every and step % checkpoint_every == 0:
+                recorder.flush()
+                automaton.save(checkpoint_path)
+
+    if exporter is not None:
+        exporter.export(automaton.grid, variables.days_elapsed)
+        exporter.close()
+    if trajectory is not None:
+        trajectory.close()
+
+    if checkpoint_every or resume:
+        automaton.save(checkpoint_path)
+
+    return {"name": variables.name} | variables.sweep_parameters | metrics
+
+
+def write_summary(summaries: list[dict], path: str) -> None:
+    """Write summary of each simulation as a row of csv file"""
+    fieldnames = {}
+    for summary in summaries:
+        fieldnames.update(dict.fromkeys(summary))
+
+    with open(path, "w", newline="", encoding="utf8") as file:
+        writer = csv.DictWriter(file, fieldnames=list(fieldnames))
+        writer.writeheader()
+        writer.writerows(summaries)
+
+
+def run_headless(simulation_variables: list[Variables], steps: int, output_dir: str,
+                 width: int, height: int, workers=1, checkpoint_every: int = None,
+                 resume=False, export: str = None, export_every=EXPORT_INTERVAL,
+                 trajectory_every: int = None) -> list[dict]:
+    """
+    Run simulations without GUI in a pool of worker processes, writing
+    metrics of each one and summary.csv of all of them to output directory.
+    See run_simulation for checkpoint_every, resume, export and trajectory_every
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    shared_geometry = SharedGeometry(Geometry.compute(width, height))
+    summaries = [None] * len(simulation_variables)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(run_simulation, variables, steps, width, height,
+                                output_dir, shared_geometry, checkpoint_every, resume,
+                                export=export, export_every=export_every,
+                                trajectory_every=trajectory_every): i
+                for i, variables in enumerate(simulation_variables)
+            }
+
+            for finished, future in enumerate(as_completed(futures), start=1):
+                summary = future.result()
+                summaries[futures[future]] = summary
+                print(f"[{finished}/{len(futures)}] {summary['name']}: "
+                      f"{steps} steps, {summary['days_elapsed']} days")
+    finally:
+        shared_geometry.unlink()
+
+    write_summary(summaries, os.path.join(output_dir, "summary.csv"))
+    return summaries
+
+
+def run_branches(trunk_variables: Variables, branch_variables: list[Variables], day: int,
+                 steps: int, output_dir: str, width: int, height: int,
+                 workers=1) -> list[dict]:
+    """
+    Grow one tumor with trunk variables until given day and continue it
+    with each of branch variables in a pool of worker processes, so all
+    branches start from the same tumor and the same state of the random
+    stream. Metrics and checkpoint of the trunk are written to output
+    directory as those of any simulation, metrics of each branch include
+    the trunk ones
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    trunk_steps = -(-day * 24 // trunk_variables.time_delta)
+    if trunk_steps >= steps:
+        raise ValueError(f"Day {day} is reached after {trunk_steps} steps, "
+                         f"branches must run for more steps than that")
+
+    shared_geometry = SharedGeometry(Geometry.compute(width, height))
+    summaries = [None] * len(branch_variables)
+
+    try:
+        run_simulation(trunk_variables, trunk_steps, width, height, output_dir,
+                       shared_geometry, checkpoint_every=trunk_steps)
+        trunk = os.path.join(output_dir, trunk_variables.name)
+        print(f"{trunk_variables.name}: {trunk_steps} steps, {day} days")
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(run_simulation, variables, steps, width, height,
+                                output_dir, shared_geometry, trunk=trunk): i
+                for i, variables in enumerate(branch_variables)
+            }
+
+            for finished, future in enumerate(as_completed(futures), start=1):
+                summary = future.result()
+                summaries[futures[future]] = summary
+                print(f"[{finished}/{len(futures)}] {summary['name']}: "
+                      f"{steps} steps, {summary['days_elapsed']} days")
+    finally:
+        shared_geometry.unlink()
+
+    write_summary(summaries, os.path.join(output_dir, "summary.csv"))
+    return summaries
+
+
+def run_replicate(variables: Variables, seed_sequence: np.random.SeedSequence, steps: int,
+                  width: int, height: int, shared_geometry: SharedGeometry = None) -> np.ndarray:
+    """
+    Make given number of steps drawing randomness from the stream of
+    the seed sequence and return (steps + 1, len(METRICS) - 1) array of
+    metrics of each step, step number excluded
+    """
+    variables.rng = np.random.default_rng(seed_sequence)
+    geometry = shared_geometry.attach() if shared_geometry else None
+    automaton = create_simulation(variables, width, height, geometry)
+
+    trajectory = np.empty((steps + 1, len(METRICS) - 1))
+    trajectory[0] = list(metrics_of(automaton, 0).values())[1:]
+    for step in range(1, steps + 1):
+        automaton.next()
+        trajectory[step] = list(metrics_of(automaton, step).values())[1:]
+    return trajectory
+
+
+def run_replicate_batch(variables: Variables, seed_sequence: np.random.SeedSequence,
+                        replicates: int, steps: int, width: int, height: int,
+                        shared_geometry: SharedGeometry = None) -> np.ndarray:
+    """
+    Make given number of steps in a batch of replicates stepped together
+    and return (replicates, steps + 1, len(METRICS) - 1) array of their
+    metrics of each step, step number excluded
+    """
+    variables.rng = np.random.default_rng(seed_sequence)
+    geometry = shared_geometry.attach() if shared_geometry else None
+    automaton = BatchAutomaton(variables, replicates, width, height, geometry)
+    automaton.place_initial_cells(width // 2, height // 2)
+
+    trajectories = np.empty((replicates, steps + 1, len(METRICS) - 1))
+    trajectories[:, 0] = batch_metrics_of(automaton)
+    for step in range(1, steps + 1):
+        automaton.next()
+        trajectories[:, step] = batch_metrics_of(automaton)
+    return trajectories
+
+
+def batch_metrics_of(automaton: BatchAutomaton) -> np.ndarray:
+    """Return (replicates, len(METRICS) - 1) array of metrics, step number excluded"""
+    variables = automaton.variables
+    return np.array([
+        [variables.days_elapsed, counter.immune_cell, counter.tumor_cell,
+         counter.proliferating_cell, counter.stem_cell, Rt, int(variables.is_treatment)]
+        for counter, Rt in zip(automaton.counters, automaton.Rt)
+    ])
+
+
+def write_statistics(statistics: OnlineStatistics, path: str) -> None:
+    """Write mean, standard deviation and quantiles of each metric for each step"""
+    columns = {"mean": statistics.mean, "std": np.sqrt(statistics.variance)}
+    for quantile in statistics.quantiles:
+        columns[f"q{quantile:g}"] = statistics.quantile(quantile)
+
+    fieldnames = ["step"] + [f"{metric}_{name}" for metric in METRICS[1:] for name in columns]
+    with open(path, "w", newline="", encoding="utf8") as file:
+        writer = csv.writer(file)
+        writer.writerow(fieldnames)
+        for step in range(statistics.mean.shape[0]):
+            writer.writerow([step] + [
+                values[step, i] for i in range(len(METRICS) - 1) for values in columns.values()
+            ])
+
+
+def run_replicates(simulation_variables: list[Variables], replicates: int, steps: int,
+                   output_dir: str, width: int, height: int, seed: int = None,
+                   workers=1, batch=1) -> list[OnlineStatistics]:
+    """
+    Run each simulation replicates times with independent random streams
+    spawned from the seed. If batch is greater than one, replicates are
+    stepped together by BatchAutomaton in batches of that size, each batch
+    drawing from its own stream. Metrics are aggregated as replicates
+    finish and written to <output_dir>/<name>_replicates.csv
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    batches = [(start, min(batch, replicates - start)) for start in range(0, replicates, batch)]
+    seed_sequences = np.random.SeedSequence(seed).spawn(len(simulation_variables) * len(batches))
+    statistics = [OnlineStatistics((steps + 1, len(METRICS) - 1)) for _ in simulation_variables]
+    shared_geometry = SharedGeometry(Geometry.compute(width, height))
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            for i, variables in enumerate(simulation_variables):
+                for j, (start, size) in enumerate(batches):
+                    seed_sequence = seed_sequences[i * len(batches) + j]
+                    if batch > 1:
+                        future = executor.submit(run_replicate_batch, variables, seed_sequence,
+                                                 size, steps, width, height, shared_geometry)
+                    else:
+                        future = executor.submit(run_replicate, variables, seed_sequence,
+                                                 steps, width, height, shared_geometry)
+                    futures[future] = (i, start)
+
+            # Replicates that finished before the preceding ones. They are
+            # added in order, so quantile estimates do not depend on timing
+            pending = [{} for _ in simulation_variables]
+
+            for finished, future in enumerate(as_completed(futures), start=1):
+                i, start = futures.pop(future)
+                trajectories = future.result()
+                if batch > 1:
+                    pending[i].update(enumerate(trajectories, start=start))
+                else:
+                    pending[i][start] = trajectories
+                while statistics[i].count in pending[i]:
+                    statistics[i].add(pending[i].pop(statistics[i].count))
+                print(f"[{finished}/{len(seed_sequences)}] {simulation_variables[i].name}: "
+                      f"{statistics[i].count}/{replicates} replicates")
+    finally:
+        shared_geometry.unlink()
+
+    for variables, simulation_statistics in zip(simulation_variables, statistics):
+        write_statistics(simulation_statistics,
+                         os.path.join(output_dir, f"{variables.name}_replicates.csv"))
+    return statistics
@@ -0,0 +1,150 @@
+"""
+Trajectory of a simulation: frames of palette codes of the grid appended
+to <path>.traj after a header, and index of the frames in <path>.idx
+with step, day and offset of each of them in the trajectory file
+"""
+
+import os
+import numpy as np
+
+
+MAGIC = b"CSIMTRAJ"
+HEADER = np.dtype([
+    ("magic", "S8"),
+    ("width", "<u4"),
+    ("height", "<u4"),
+    ("palette", "u1", (256, 3)),
+])
+INDEX = np.dtype([
+    ("step", "<i8"),
+    ("day", "<i8"),
+    ("offset", "<i8"),
+])
+
+
+def index_path(path: str) -> str:
+    """Return path of the index of trajectory file"""
+    return os.path.splitext(path)[0] + ".idx"
+
+
+class TrajectoryWriter:
+    """
+    Appends frame of the grid to trajectory file every interval steps.
+    Frame is added to the index after it is written, so index lists
+    only complete frames even if the process is killed
+    """
+
+    def __init__(self, path: str, width: int, height: int, palette: np.ndarray,
+                 interval=1, resume_step: int = None) -> None:
+        """
+        Create trajectory file <path>.traj and its index. If resume_step is
+        given and the trajectory exists, it is continued instead: frames
+        of resume_step and later steps are dropped from it
+        """
+        self.path = path + ".traj"
+        self.interval = interval
+        self.frame = np.empty((height, width), dtype=np.uint8)
+
+        if resume_step is not None and os.path.exists(self.path):
+            self.truncate(width, height, resume_step)
+            self.file = open(self.path, "ab")
+            self.index = open(index_path(self.path), "ab")
+            return
+
+        header = np.zeros((), HEADER)
+        header["magic"] = MAGIC
+        header["width"] = width
+        header["height"] = height
+        header["palette"] = palette
+
+        self.file = open(self.path, "wb")
+        self.file.write(header.tobytes())
+        self.index = open(index_path(self.path), "wb")
+
+    def truncate(self, width: int, height: int, step: int) -> None:
+        """Remove frames of given step and later ones, and incomplete ones"""
+        trajectory = Trajectory(self.path)
+        if (trajectory.width, trajectory.height) != (width, height):
+            raise ValueError(f"Trajectory {self.path} of {trajectory.width}x{trajectory.height} "
+                             f"grid cannot be continued on {width}x{height} grid")
+
+        kept = int(np.searchsorted(trajectory.index["step"], step))
+        if kept < len(trajectory):
+            end = int(trajectory.index[kept]["offset"])
+        elif kept:
+            end = int(trajectory.index[kept - 1]["offset"]) + width * height
+        else:
+            end = HEADER.itemsize
+        del trajectory
+
+        os.truncate(self.path, end)
+        os.truncate(index_path(self.path), kept * INDEX.itemsize)
+
+    def record(self, grid, step: int, day: int) -> None:
+        """Append frame of the grid if step is a multiple of interval"""
+        if step % self.interval:
+            return
+
+        grid.render(self.frame)
+        entry = np.array((step, day, self.file.tell()), INDEX)
+        self.file.write(self.frame.tobytes())
+        self.file.flush()
+        self.index.write(entry.tobytes())
+        self.index.flush()
+
+    def close(self) -> None:
+        """Close trajectory file and its index"""
+        self.file.close()
+        self.index.close()
+
+
+class Trajectory:
+    """
+    Trajectory file mapped to memory, frames are read from disk only
+    when they are accessed
+    """
+
+    def __init__(self, path: str) -> None:
+        """Open trajectory file written by TrajectoryWriter"""
+        self.path = path
+        header = np.fromfile(path, HEADER, count=1)
+        if len(header) == 0 or header[0]["magic"] != MAGIC:
+            raise ValueError(f"{path} is not a trajectory file")
+
+        self.width = int(header[0]["width"])
+        self.height = int(header[0]["height"])
+        self.palette = header[0]["palette"].copy()
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Map frames written since the file was opened, if it is still being written"""
+        index = np.fromfile(index_path(self.path), np.uint8)
+        # Last entry may be incomplete while it is written
+        self.index = index[:len(index) // INDEX.itemsize * INDEX.itemsize].view(INDEX)
+        self.data = np.memmap(self.path, np.uint8, mode="r")
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def frame(self, i: int) -> np.ndarray:
+        """Return (height, width) palette codes of frame i"""
+        offset = int(self.index[i]["offset"])
+        return self.data[offset:offset + self.width * self.height].reshape(
+            self.height, self.width
+        )
+
+    def picture(self, i: int) -> np.ndarray:
+        """Return (height, width, 3) RGB picture of frame i"""
+        return self.palette[self.frame(i)]
+
+    def step(self, i: int) -> int:
+        """Return step of frame i"""
+        return int(self.index[i]["step"])
+
+    def day(self, i: int) -> int:
+        """Return day of frame i"""
+        return int(self.index[i]["day"])
+
+    def find_day(self, day: int) -> int:
+        """Return number of the first frame of given day or later one"""
+        return min(int(np.searchsorted(self.index["day"], day)), len(self) - 1)
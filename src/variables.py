@@ -1,4 +1,5 @@
 """Variables"""
+from itertools import product
 import yaml
 import numpy as np
 
@@ -22,8 +23,12 @@ class Variables:
                  treatment_start_time=10, injection_interval=10,
                  time_constant=3, drug_concentration=0.1,
                  max_proliferation_potential=20,
+                 engine="object", debug=False, seed=None,
                  ) -> None:
         self.name = name
+        self.engine = engine
+        self.debug = debug
+        self.seed = seed
 
         # Static variables
         self.p0 = p0
@@ -71,6 +76,12 @@ class Variables:
         self.time_delta = 5
         self.time = 0
 
+        # All randomness of the simulation is drawn from this stream
+        self.rng = np.random.default_rng(seed)
+
+        # Values of swept parameters if created by parameter sweep
+        self.sweep_parameters = {}
+
         self.color_delta = ( MAX_PROLIFERATION_COLOR - LOW_PROLIFERATION_COLOR ) / self.max_proliferation_potential
 
     @property
@@ -129,10 +140,37 @@ class ConfigFileException(Exception):
     """Exception for incorrect config file"""
 
 
+def read_sweep_points(sweep_config: dict) -> list[dict]:
+    """
+    Return list of parameter values from `sweep` section: either Cartesian
+    product of lists in `product` or explicitly listed `points`
+    """
+    if ("product" in sweep_config) == ("points" in sweep_config):
+        raise ConfigFileException("You must define either `product` or `points` in `sweep` section")
+
+    if "points" in sweep_config:
+        points = sweep_config["points"]
+        if not isinstance(points, list) or not all(isinstance(point, dict) for point in points):
+            raise ConfigFileException("`points` in `sweep` section must be a list of parameter sets")
+        return points
+
+    parameters = sweep_config["product"]
+    if not isinstance(parameters, dict) or not all(isinstance(values, list) for values in parameters.values()):
+        raise ConfigFileException("`product` in `sweep` section must map parameters to lists of values")
+
+    return [dict(zip(parameters, values)) for values in product(*parameters.values())]
+
+
+def sweep_name(name: str, point: dict) -> str:
+    """Return name of the simulation with given swept parameters"""
+    return "_".join([name, *(f"{parameter}={value}" for parameter, value in point.items())])
+
+
 def read_variables(filepath: str) -> list[Variables]:
     """
     Read configuration file and return list of Variables for
-    each proposed simulation 
+    each proposed simulation. If config has `sweep` section, each
+    simulation is repeated for every point of the sweep
     """
 
     config = {}
@@ -152,6 +190,9 @@ def read_variables(filepath: str) -> list[Variables]:
         if not simulation_list:
             raise ConfigFileException("You must define `simulations` section in you config file")
 
+        sweep_config = config.get("sweep")
+        sweep_points = read_sweep_points(sweep_config) if sweep_config else [{}]
+
         for simulation_identifier, simulation_config in simulation_list.items():
             simulation_name = simulation_config.get('name')
 
@@ -159,11 +200,27 @@ def read_variables(filepath: str) -> list[Variables]:
                 raise ConfigFileException(f"You must define `name` in simulation\
                                            {simulation_identifier}")
 
-            simulation_variables = global_variables | simulation_config
+            for point in sweep_points:
+                simulation_variables = global_variables | simulation_config | point
+                if point:
+                    simulation_variables["name"] = sweep_name(simulation_name, point)
 
-            if len(variables) != 4:
                 variables.append(Variables(**simulation_variables))
-            else:
-                raise ConfigFileException("You can set 4 simulations at most")
+                variables[-1].sweep_parameters = point
 
     return variables
+
+
+def read_global_variables(filepath: str, name="trunk") -> Variables:
+    """Read configuration file and return Variables of its `global` section"""
+    with open(filepath, 'r', encoding="utf8") as stream:
+        try:
+            config = yaml.safe_load(stream)
+        except yaml.YAMLError:
+            raise ValueError("You passed incorrect yaml file")
+
+    global_variables = config.get('global')
+    if not global_variables:
+        raise ConfigFileException("You must define `global` section in you config file")
+
+    return Variables(**global_variables | {"name": name})